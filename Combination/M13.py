@@ -1,34 +1,96 @@
-from openpyxl import load_workbook
+import os
+import numpy as np
+from file_hash import fileHash
 
 
 index = {1:4,50:3,100:2,500:1,1000:0} #used by setUltrasound()
 
 
-class M13Phage:
-        
-    def __init__(self, fileName):
+#voltage tables already loaded in this process, shared by every M13Phage
+#{absolute path: ((mtime, size), intensities, voltages)}
+loaded_tables = {}
 
-        #initialize hashmap 
-        self.intensity_to_voltage_dict = {}
 
-        #read the excel file provided by Arash
-        workbook = load_workbook(fileName, data_only=True)
-        worksheet = workbook.active
-    
-        #iterate through each row starting at the 5th row
-        for row in worksheet.iter_rows(min_row=5): 
+#parse the excel file provided by Arash -> (intensities, voltages[row][column])
+def readWorkbook(fileName):
+
+    #openpyxl is slow to import, only needed when the npz sidecar is missing or stale
+    from openpyxl import load_workbook
+
+    intensity_to_voltage_dict = {}
+
+    workbook = load_workbook(fileName, data_only=True)
+    worksheet = workbook.active
+
+    #iterate through each row starting at the 5th row
+    for row in worksheet.iter_rows(min_row=5): 
+
+        #save the row's column values into a list
+        row_values = [cell.value for cell in row]
+
+        #intensity is at column B of the excel file, corresponding voltages are at column C onwards
+        intensity_to_voltage_dict[row_values[2]] = row_values[3:]
+
+    intensities = np.array(list(intensity_to_voltage_dict.keys()), dtype=float)
+    voltages = np.array(list(intensity_to_voltage_dict.values()), dtype=float)
+
+    return (intensities, voltages)
+
 
-            #save the row's column values into a list
-            row_values = [cell.value for cell in row]
+#returns (intensities, voltages) for an excel file. The parsed table is kept in a
+#binary sidecar (fileName + '.npz') that is reused while the excel file keeps the
+#same mtime/size (or the same content hash), and in memory for the whole process
+def loadVoltageTable(fileName):
 
-            #intensity is at column B of the excel file
-            intensity = row_values[2] 
+    path = os.path.abspath(fileName)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
 
-            #corresponding voltages are at column C onwards
-            voltages = row_values[3:] 
+    if path in loaded_tables and loaded_tables[path][0] == stamp:
+        return loaded_tables[path][1:]
 
-            #add to hashmap
-            self.intensity_to_voltage_dict[intensity] = voltages
+    sidecar = path + '.npz'
+    sidecar_stamp = None
+    digest = None
+    table = None
+
+    try:
+        with np.load(sidecar) as data:
+            sidecar_stamp = tuple(data['stamp'].tolist())
+            if sidecar_stamp != stamp:
+                digest = fileHash(path)
+            if sidecar_stamp == stamp or str(data['sha256']) == digest:
+                table = (data['intensities'], data['voltages'])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if table is None:
+        table = readWorkbook(path)
+
+    #(re)write the sidecar when it is missing, stale or only matched by hash
+    if sidecar_stamp != stamp:
+        try:
+            temp_path = sidecar + '.%d.tmp' % os.getpid()
+            with open(temp_path, 'wb') as sidecar_file:
+                np.savez(sidecar_file, stamp=np.array(stamp), sha256=digest or fileHash(path),
+                         intensities=table[0], voltages=table[1])
+            os.replace(temp_path, sidecar)
+        except OSError:
+            pass #read-only folder, the table is still cached in memory
+
+    loaded_tables[path] = (stamp,) + table
+    return table
+
+
+class M13Phage:
+        
+    def __init__(self, fileName):
+
+        #read the voltage table (parsed once per process, see loadVoltageTable)
+        self.intensity_array, self.voltage_array = loadVoltageTable(fileName)
+
+        #initialize hashmap 
+        self.intensity_to_voltage_dict = dict(zip(self.intensity_array.tolist(), self.voltage_array.tolist()))
 
         #also initialize a list of all possible input ultrasound intensities (helps when interpolating an input)
         self.intensities = list(self.intensity_to_voltage_dict.keys())
@@ -68,6 +130,53 @@ class M13Phage:
         self.output_voltage = voltage
 
 
+    #vectorized lookup for sweeps/ultrasound fields: voltages for arrays of intensities and
+    #channel counts (broadcast against each other). Uses binary search on the sorted table and
+    #bilinear interpolation over intensity x number of channels, so any channel count between
+    #1 and 1000 works. Intensities outside the table, and the lowest table intensity itself,
+    #give 0V like setUltrasound(). Scalar inputs give a scalar voltage.
+    #Note: this is plain linear interpolation, setUltrasound() also multiplies the slope
+    #term by the intensity, so the two differ between table rows. interpolation="setUltrasound"
+    #uses its formula instead (channel counts must then be table columns) and gives the same
+    #voltages as calling setUltrasound() for every point
+    def getVoltages(self, intensities, channels, interpolation="linear"):
+
+        scalar = np.ndim(intensities) == 0 and np.ndim(channels) == 0
+        intensities, channels = np.broadcast_arrays(np.atleast_1d(np.asarray(intensities, dtype=float)),
+                                                    np.atleast_1d(np.asarray(channels, dtype=float)))
+
+        #table columns sorted by number of channels (see index)
+        table_channels = np.array(sorted(index), dtype=float)
+        table = self.voltage_array[:, [index[c] for c in sorted(index)]]
+        x = self.intensity_array
+
+        if np.any((channels < table_channels[0]) | (channels > table_channels[-1])):
+            raise ValueError('number of channels must be between %d and %d' % (table_channels[0], table_channels[-1]))
+
+        #cell of the table each point falls into and the position inside it
+        i = np.clip(np.searchsorted(x, intensities, side='right') - 1, 0, len(x) - 2)
+        j = np.clip(np.searchsorted(table_channels, channels, side='right') - 1, 0, len(table_channels) - 2)
+
+        if interpolation == "setUltrasound":
+            if not np.all(np.isin(channels, table_channels)):
+                raise ValueError('number of channels must be one of ' + ', '.join('%d' % c for c in table_channels))
+            column = np.searchsorted(table_channels, channels)
+            y1 = table[i, column]
+            y2 = table[i+1, column]
+            voltages = (((y2 - y1)/(x[i+1] - x[i]))*(intensities*(intensities - x[i]))) + y1
+            voltages = np.where(intensities == x[i+1], y2, voltages)
+        elif interpolation == "linear":
+            fx = (intensities - x[i])/(x[i+1] - x[i])
+            fy = (channels - table_channels[j])/(table_channels[j+1] - table_channels[j])
+            voltages = ((1 - fx)*(1 - fy)*table[i, j] + fx*(1 - fy)*table[i+1, j]
+                        + (1 - fx)*fy*table[i, j+1] + fx*fy*table[i+1, j+1])
+        else:
+            raise ValueError('unknown interpolation "%s"' % interpolation)
+
+        voltages = np.where((intensities <= x[0]) | (intensities > x[-1]), 0.0, voltages)
+        return float(voltages[0]) if scalar else voltages
+
+
     #function to get the output voltage
     def getVoltage(self):
         return self.output_voltage
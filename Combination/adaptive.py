@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Adaptive-step integration of the coupled ChR2 + Izhikevich system
+
+The state [v, u, c1, o1, o2, c2, p] of the Izhikevich membrane model and the
+four-state ChR2 model is advanced with the embedded Dormand-Prince 5(4) pair.
+The step size follows the local error estimate, so steps are short around
+light onset and spikes and long in between. Steps never straddle a light
+edge of the LightProtocol, and the ap_threshold crossing is located inside
+the step (cubic Hermite interpolation) and the reset is applied at that time.
+
+"""
+import math
+import numpy as np
+
+# Dormand-Prince 5(4) coefficients (the stage times are not needed, the
+# irradiance is constant within a step so the system is autonomous there)
+A = ((),
+     (1/5,),
+     (3/40, 9/40),
+     (44/45, -56/15, 32/9),
+     (19372/6561, -25360/2187, 64448/6561, -212/729),
+     (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+     (35/384, 0.0, 500/1113, 125/192, -2187/6784, 11/84))
+# 5th order weights are the last row of A, E holds 5th minus 4th order weights
+E = np.array([71/57600, 0.0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40])
+
+class AdaptiveIntegrator:
+    def __init__(self, membrane_model, opsin, protocol, rtol=1e-5, atol=1e-7, h_initial=0.01, h_max=10.0, h_min=1e-10):
+        # Izhikevich membrane model, Channelrhodopsin (four-state model) and simulation.LightProtocol
+        self.membrane_model = membrane_model
+        self.opsin = opsin
+        self.protocol = protocol
+        self.rtol = rtol
+        self.atol = atol
+        # first trial step, step after a spike reset and step limits (ms)
+        self.h_initial = h_initial
+        self.h_max = h_max
+        self.h_min = h_min
+        self.resetStats()
+
+    def resetStats(self):
+        self.stats = {'accepted': 0, 'rejected': 0, 'evaluations': 0, 'spikes': 0,
+                      'h_min': math.inf, 'h_max': 0.0}
+
+    def getStats(self):
+        return dict(self.stats)
+
+    # current state of the models as [v, u, c1, o1, o2, c2, p]
+    def getState(self):
+        izhikevich = self.membrane_model
+        model = self.opsin.getModel()
+        return np.array([izhikevich.v, izhikevich.u, model.c1, model.o1, model.o2, model.c2, model.p], dtype=float)
+
+    def getVoltage(self, v):
+        return self.opsin.getHoldingPotential() if self.opsin.Vclamp else v
+
+    def getPhotocurrent(self, y):
+        model = self.opsin.getModel()
+        return model.getCurrentScale(self.getVoltage(y[0]), self.opsin.g_ChR2) * (y[3] + model.gamma*y[4])
+
+    # time derivative of the state for a constant irradiance
+    def getDerivatives(self, y, irr):
+        self.stats['evaluations'] += 1
+        izhikevich = self.membrane_model
+        model = self.opsin.getModel()
+        v, u, c1, o1, o2, c2, p = y
+
+        V = self.getVoltage(v)
+        Gd1, e12, e21, Gr, Gd2, a1, a2 = model.getRates(irr, V, self.opsin.wavelength)
+        dC1O1 = a1*p*c1
+        dO1C1 = Gd1*o1
+        dO1O2 = e12*o1
+        dO2O1 = e21*o2
+        dO2C2 = Gd2*o2
+        dC2O2 = a2*p*c2
+        dC2C1 = Gr*c2
+
+        I = abs(model.getCurrentScale(V, self.opsin.g_ChR2) * (o1 + model.gamma*o2))
+        return np.array([(0.04 * v ** 2) + (5.0 * v) + 140.0 - u + I,
+                         izhikevich.a * ((izhikevich.b * v) - u),
+                         dC2C1 + dO1C1 - dC1O1,
+                         dC1O1 + dO2O1 - dO1C1 - dO1O2,
+                         dC2O2 + dO1O2 - dO2C2 - dO2O1,
+                         dO2C2 - dC2O2 - dC2C1,
+                         (model.So(irr) - p)/model.T_ChR2])
+
+    # one Dormand-Prince step from y with derivative f, returns (y_new, f_new, error norm);
+    # a step too long for the quadratic v can send a stage off to huge values, the error
+    # norm is then inf so the step is rejected like any other inaccurate step
+    def step(self, y, f, h, irr):
+        k = [f]
+        try:
+            with np.errstate(over='ignore', invalid='ignore'):
+                for i in range(1, 7):
+                    yi = y + h*sum(a*ki for a, ki in zip(A[i], k))
+                    k.append(self.getDerivatives(yi, irr))
+                # the last stage is evaluated at y_new (first same as last)
+                y_new = yi
+                error = h*sum(e*ki for e, ki in zip(E, k))
+                scale = self.atol + self.rtol*np.maximum(np.abs(y), np.abs(y_new))
+                norm = math.sqrt(np.mean((error/scale)**2))
+        except OverflowError:
+            return (y, f, math.inf)
+        if not (math.isfinite(norm) and np.all(np.isfinite(y_new))):
+            return (y, f, math.inf)
+        return (y_new, k[6], norm)
+
+    # cubic Hermite interpolation inside a step at fraction theta
+    def interpolate(self, y0, f0, y1, f1, h, theta):
+        theta2 = theta*theta
+        theta3 = theta2*theta
+        return ((2*theta3 - 3*theta2 + 1)*y0 + (theta3 - 2*theta2 + theta)*h*f0
+                + (-2*theta3 + 3*theta2)*y1 + (theta3 - theta2)*h*f1)
+
+    # fraction of the step at which v reaches the threshold (v(0) < threshold <= v(1))
+    def findCrossing(self, y0, f0, y1, f1, h, threshold):
+        low, high = 0.0, 1.0
+        for _ in range(60):
+            middle = 0.5*(low + high)
+            v = self.interpolate(y0[0], f0[0], y1[0], f1[0], h, middle)
+            if v >= threshold:
+                high = middle
+            else:
+                low = middle
+        return high
+
+    # next light edge strictly after t
+    def getSegmentEnd(self, t):
+        edge = self.protocol.nextEdge(t)
+        if edge <= t:
+            edge = self.protocol.nextEdge(math.nextafter(t, math.inf))
+        return edge
+
+    # integrates from t_start to t_end, returns (times, states) at every accepted step (states has
+    # columns v, u, c1, o1, o2, c2, p) or on a uniform grid of sample_dt if it is given; spikes go to
+    # the Izhikevich spike_times recorder and the models are left in the final state
+    def run(self, t_start, t_end, sample_dt=None):
+        izhikevich = self.membrane_model
+        model = self.opsin.getModel()
+
+        t = t_start
+        y = self.getState()
+        f = None
+        f_irr = None
+        h = self.h_initial
+
+        times = [t]
+        states = [y]
+        next_sample = t_start + sample_dt if sample_dt else None
+
+        while t < t_end:
+            # the irradiance is constant within a step
+            segment_end = min(self.getSegmentEnd(t), t_end)
+            h = min(h, self.h_max, segment_end - t)
+            irr = self.protocol.getIrradiance(t + 0.5*h)
+            if f is None or irr != f_irr:
+                f = self.getDerivatives(y, irr)
+                f_irr = irr
+
+            y_new, f_new, error = self.step(y, f, h, irr)
+            if math.isinf(error) and h <= self.h_min:
+                raise OverflowError("no finite step of at least h_min at t = " + str(t))
+            if error > 1.0 and h > self.h_min:
+                self.stats['rejected'] += 1
+                h = max(h*max(0.2, 0.9*error**(-0.2)), self.h_min)
+                continue
+
+            spiked = y_new[0] >= izhikevich.v_thresh
+            if spiked:
+                # move the end of the step back to the threshold crossing
+                theta = self.findCrossing(y, f, y_new, f_new, h, izhikevich.v_thresh)
+                y_new = self.interpolate(y, f, y_new, f_new, h, theta)
+                f_new = self.getDerivatives(y_new, irr)
+                h_taken = theta*h
+            else:
+                h_taken = h
+
+            if sample_dt:
+                while next_sample <= t + h_taken and next_sample <= t_end:
+                    theta = (next_sample - t)/h_taken
+                    times.append(next_sample)
+                    states.append(self.interpolate(y, f, y_new, f_new, h_taken, theta))
+                    next_sample = t_start + (len(times))*sample_dt
+
+            self.stats['accepted'] += 1
+            self.stats['h_min'] = min(self.stats['h_min'], h_taken)
+            self.stats['h_max'] = max(self.stats['h_max'], h_taken)
+            t = t + h_taken
+            y = y_new
+            f = f_new
+
+            if spiked:
+                izhikevich.spike_times.append(t)
+                izhikevich.spiked = True
+                self.stats['spikes'] += 1
+                y = y.copy()
+                y[0] = izhikevich.c
+                y[1] = y[1] + izhikevich.d
+                f = self.getDerivatives(y, irr)
+                h = self.h_initial
+            else:
+                h = h*min(5.0, max(0.2, 0.9*error**(-0.2))) if error > 0 else 5.0*h
+
+            if not sample_dt:
+                times.append(t)
+                states.append(y)
+
+        # leave the models in the final state
+        v, u, c1, o1, o2, c2, p = (float(x) for x in y)
+        I_ChR2 = self.getPhotocurrent(y)
+        model.setState(c1, o1, o2, c2, p)
+        self.opsin.setI(I_ChR2)
+        izhikevich.setState(v, u, abs(I_ChR2))
+
+        return (np.array(times), np.array(states))
@@ -1,9 +1,12 @@
-from numpy import arange, zeros
+from numpy import arange, zeros, broadcast_arrays
 import matplotlib.pyplot as plt
 from photon_emission import PhotonEmission
 from ser import SmoothEndoRet
 from calcium import CalciumCluster
 from M13 import M13Phage
+from light_transfer import LightTransferTable
+from zap_cache import ZapCache, getZapParameters
+from zap_engine import zapAutoDt, zapChunks, zapToRecorders, zapToStore, zapVectorized, zapVectorizedBatch
 
 
 # =============================================================================
@@ -38,6 +41,9 @@ diffusion_coefficient = 1E-8
 aequorin_radius = 1E-8
 photon_emiter = PhotonEmission(init_Pout, Pout_max, diffusion_coefficient, aequorin_radius, dt)
 
+#Vt -> (Pout, light intensity) lookup table used by zap(engine="table")
+light_table = LightTransferTable(calcium_model, photon_emiter, Vrest, Vmax, dt)
+
 
 #file path of the excel provided by Arash
 filePath = 'M13_Voltage_V3.xlsx'
@@ -45,6 +51,9 @@ filePath = 'M13_Voltage_V3.xlsx'
 #instantiate bacteriophage model object
 bacteriophage = M13Phage(filePath)
 
+#on-disk cache of zap() results, used by cachedZap()
+zap_cache = ZapCache('.zap_cache')
+
 
 
 
@@ -58,7 +67,19 @@ S_array = arange(0, S, dt)
 
 #this function performs the entire simulation from a given input ultrasound intensity returns
 #value arrays for the membrane voltage, extracellular concentration and light intensity over time
-def zap(input_soundwave, channels):
+#engine="loop" steps every dt, engine="table" also steps but reads calcium/light from light_table,
+#engine="vectorized" builds the same arrays with NumPy (see zap_engine.py)
+#with a recording policy ('full', ('decimate', k), ('envelope', k) or a list of three, see downsample.py)
+#the traces are reduced while they are recorded and the three recorders are returned instead of arrays
+def zap(input_soundwave, channels, engine="loop", recording=None):
+    
+    if recording is not None:
+        if engine == "vectorized":
+            #streamed in chunks, so the full traces are never held in memory
+            chunks = zapStream(input_soundwave, channels)
+        else:
+            chunks = [(S_array,) + zap(input_soundwave, channels, engine)]
+        return zapToRecorders(chunks, recording)
     
     #set the input intensity on the M13 (determines the output source voltage)
     bacteriophage.setUltrasound(input_soundwave, channels)
@@ -66,6 +87,11 @@ def zap(input_soundwave, channels):
     #get the new source voltage (i.e., what is being applied to the ser)
     Vb = bacteriophage.getVoltage()
 
+    if engine == "vectorized":
+        return zapVectorized(Vb, channels, Vrest, Vmax, dt, len(S_array), calcium_model, photon_emiter)
+    elif engine not in ("loop", "table"):
+        raise ValueError(f'unknown zap engine "{engine}"')
+
     #instantiate SER class
     ser = SmoothEndoRet(channels, Vrest, Vmax, dt)
     
@@ -93,11 +119,15 @@ def zap(input_soundwave, channels):
         #add new membrane voltage to array at corresponding time step (in mV)
         Vt_array[t] = Vt * 1000
         
-        #update/get real concentrations according to new voltage
-        ratio, Pin_t, Pout_t = calcium_model.updateConcentrations(Vt)
+        if engine == "table":
+            #interpolated concentration and light intensity for the new voltage
+            Pout_t, output_intensity = light_table.lookupVoltage(Vt)
+        else:
+            #update/get real concentrations according to new voltage
+            ratio, Pin_t, Pout_t = calcium_model.updateConcentrations(Vt)
 
-        #update light intensity according to new extracellular concentration
-        output_intensity = photon_emiter.getLightIntensity(Pout_t,dt)
+            #update light intensity according to new extracellular concentration
+            output_intensity = photon_emiter.getLightIntensity(Pout_t,dt)
 
         #add new concentration to array (in mM)
         Pt_out_array[t] = Pout_t  * 1000
@@ -110,6 +140,65 @@ def zap(input_soundwave, channels):
             light_array)#<----- THIS WOULD BE THE INPUT FOR THE OPSIN NEURON
 
 
+#same as zap() but repeated configurations are read back from zap_cache instead of being simulated,
+#the key covers every parameter that changes the outputs (see zap_cache.getZapParameters)
+def cachedZap(input_soundwave, channels, engine="vectorized"):
+
+    constants = {'Pout': Pout, 'Vrest': Vrest, 'Vmax': Vmax, 'dt': dt, 'S': S, 'n_steps': len(S_array),
+                 'diffusion_coefficient': diffusion_coefficient, 'aequorin_radius': aequorin_radius}
+    parameters = getZapParameters(input_soundwave, channels, engine, constants, filePath, light_table)
+
+    arrays = zap_cache.getOrCompute(parameters, lambda: zap(input_soundwave, channels, engine))
+
+    #leave the M13 in the same state as zap() would (the scripts read its voltage for labels)
+    bacteriophage.setUltrasound(input_soundwave, channels)
+    return arrays
+
+
+#zap() with the SER time step chosen from its time constant (see zap_engine.zapAutoDt), the outputs
+#are given on time_grid (S_array by default) and the chosen step is returned as a 4th value
+def zapAuto(input_soundwave, channels, time_grid=None, reset_tolerance=1E-3):
+
+    bacteriophage.setUltrasound(input_soundwave, channels)
+    if time_grid is None:
+        time_grid = S_array
+
+    return zapAutoDt(bacteriophage.getVoltage(), channels, Vrest, Vmax, time_grid, dt, calcium_model, photon_emiter, reset_tolerance)
+
+
+#streaming version of zap() for long runs (e.g. 100 ms): yields (time, Vt, Pout, light) chunks of
+#chunk_size samples in the same units as zap() without ever allocating the full arrays
+#(duration=None keeps streaming until the consumer stops)
+def zapStream(input_soundwave, channels, duration=S, chunk_size=1000000):
+
+    bacteriophage.setUltrasound(input_soundwave, channels)
+    n_steps = None if duration is None else int(round(duration/dt))
+
+    return zapChunks(bacteriophage.getVoltage(), channels, Vrest, Vmax, dt, n_steps, calcium_model, photon_emiter, chunk_size)
+
+
+#runs zapStream() and writes the traces to a directory on disk instead of keeping them in RAM
+#(open them lazily with trace_store.openTraces(directory))
+def zapToDisk(input_soundwave, channels, directory, duration=S, chunk_size=1000000):
+
+    parameters = {'input_soundwave': input_soundwave, 'channels': channels, 'Pout': Pout,
+                  'Vrest': Vrest, 'Vmax': Vmax, 'dt': dt, 'duration': duration}
+
+    return zapToStore(zapStream(input_soundwave, channels, duration, chunk_size), directory, dt, parameters)
+
+
+#runs zap() for many (soundwave intensity, number of channels) pairs in one call, the
+#inputs are broadcast against each other and every output has shape (n_configs, len(S_array))
+def zapBatch(input_soundwaves, channels):
+
+    input_soundwaves, channels = broadcast_arrays(input_soundwaves, channels)
+
+    #source voltage of the M13 for every configuration, same values as setUltrasound()
+    Vbs = bacteriophage.getVoltages(input_soundwaves.ravel(), channels.ravel(), interpolation="setUltrasound")
+
+    return zapVectorizedBatch(Vbs, channels.ravel(), Vrest, Vmax, dt, len(S_array), calcium_model, photon_emiter)
+
+
 
 
 
@@ -143,12 +232,13 @@ i=0 #this helps with parsing through the plot columns
 #run simulations and graph everything
 for channel, input_intensities in channels_to_test.items():
 
-    for intensity, colour in input_intensities:
+    #run every intensity for this number of channels in one batch -> get output rows
+    (Vt_arrs, extra_conc_arrs, light_arrs) = zapBatch([intensity for intensity, colour in input_intensities], channel)
 
-        #run zap() -> get output 
-        (Vt_arr, extra_conc_arr, light_arr) = zap(intensity, channel)
+    for (intensity, colour), Vt_arr, extra_conc_arr, light_arr in zip(input_intensities, Vt_arrs, extra_conc_arrs, light_arrs):
 
         #get M13's volatge (for graph labels)
+        bacteriophage.setUltrasound(intensity, channel)
         v = bacteriophage.getVoltage()*1000
 
         #format label
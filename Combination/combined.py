@@ -1,16 +1,23 @@
-from numpy import arange, zeros, array
+from numpy import arange, zeros
 import matplotlib.pyplot as plt
 from photon_emission import PhotonEmission
 from ser import SmoothEndoRet
 from calcium import CalciumCluster
 from M13 import M13Phage
+from light_transfer import LightTransferTable
+from zap_cache import ZapCache, getZapParameters
+from zap_engine import averageTopLight, zapAutoDt, zapChunks, zapToRecorders, zapToStore, zapVectorized
 
 from neuron import Neuron
 from izhikevich import Izhikevich
 from channelrhodopsin import Channelrhodopsin
 from four_state_model import FourStateModel
+from simulation import LightProtocol
+from headless import HeadlessSimulation
+from frame_scheduler import FrameScheduler, PlotBuffer
+from recorder import RingRecorder
+from downsample import makeRecorder, envelopeForPixels, lttbForPixels, downsample
 from vpython import *
-import copy
 
 # =============================================================================
 # Nano Bubble Component
@@ -44,12 +51,18 @@ diffusion_coefficient = 1E-8
 aequorin_radius = 1E-8
 photon_emiter = PhotonEmission(init_Pout, Pout_max, diffusion_coefficient, aequorin_radius, dt)
 
+#Vt -> (Pout, light intensity) lookup table used by zap(engine="table")
+light_table = LightTransferTable(calcium_model, photon_emiter, Vrest, Vmax, dt)
+
 #file path of the excel provided by Arash
 filePath = 'M13_Voltage_V3.xlsx'
 
 #instantiate bacteriophage model object
 bacteriophage = M13Phage(filePath)
 
+#on-disk cache of zap() results, used by cachedZap()
+zap_cache = ZapCache('.zap_cache')
+
 # =============================================================================
 #  zap() method will run a single simulation for a given soundwave intensity
 #  and a given number of ser channels.
@@ -60,7 +73,19 @@ S_array = arange(0, S, dt)
 
 #this function performs the entire simulation from a given input ultrasound intensity returns
 #value arrays for the membrane voltage, extracellular concentration and light intensity over time
-def zap(input_soundwave, channels):
+#engine="loop" steps every dt, engine="table" also steps but reads calcium/light from light_table,
+#engine="vectorized" builds the same arrays with NumPy (see zap_engine.py)
+#with a recording policy ('full', ('decimate', k), ('envelope', k) or a list of three, see downsample.py)
+#the traces are reduced while they are recorded and the three recorders are returned instead of arrays
+def zap(input_soundwave, channels, engine="loop", recording=None):
+    
+    if recording is not None:
+        if engine == "vectorized":
+            #streamed in chunks, so the full traces are never held in memory
+            chunks = zapStream(input_soundwave, channels)
+        else:
+            chunks = [(S_array,) + zap(input_soundwave, channels, engine)]
+        return zapToRecorders(chunks, recording)
     
     #set the input intensity on the M13 (determines the output source voltage)
     bacteriophage.setUltrasound(input_soundwave, channels)
@@ -68,6 +93,11 @@ def zap(input_soundwave, channels):
     #get the new source voltage (i.e., what is being applied to the ser)
     Vb = bacteriophage.getVoltage()
 
+    if engine == "vectorized":
+        return zapVectorized(Vb, channels, Vrest, Vmax, dt, len(S_array), calcium_model, photon_emiter)
+    elif engine not in ("loop", "table"):
+        raise ValueError(f'unknown zap engine "{engine}"')
+
     #instantiate SER class
     ser = SmoothEndoRet(channels, Vrest, Vmax, dt)
     
@@ -95,11 +125,15 @@ def zap(input_soundwave, channels):
         #add new membrane voltage to array at corresponding time step (in mV)
         Vt_array[t] = Vt * 1000
         
-        #update/get real concentrations according to new voltage
-        ratio, Pin_t, Pout_t = calcium_model.updateConcentrations(Vt)
+        if engine == "table":
+            #interpolated concentration and light intensity for the new voltage
+            Pout_t, output_intensity = light_table.lookupVoltage(Vt)
+        else:
+            #update/get real concentrations according to new voltage
+            ratio, Pin_t, Pout_t = calcium_model.updateConcentrations(Vt)
 
-        #update light intensity according to new extracellular concentration
-        output_intensity = photon_emiter.getLightIntensity(Pout_t,dt)
+            #update light intensity according to new extracellular concentration
+            output_intensity = photon_emiter.getLightIntensity(Pout_t,dt)
 
         #add new concentration to array (in mM)
         Pt_out_array[t] = Pout_t  * 1000
@@ -111,25 +145,61 @@ def zap(input_soundwave, channels):
             Pt_out_array, 
             light_array)#<----- THIS WOULD BE THE INPUT FOR THE OPSIN NEURON
 
+
+#same as zap() but repeated configurations are read back from zap_cache instead of being simulated,
+#the key covers every parameter that changes the outputs (see zap_cache.getZapParameters)
+def cachedZap(input_soundwave, channels, engine="vectorized"):
+
+    constants = {'Pout': Pout, 'Vrest': Vrest, 'Vmax': Vmax, 'dt': dt, 'S': S, 'n_steps': len(S_array),
+                 'diffusion_coefficient': diffusion_coefficient, 'aequorin_radius': aequorin_radius}
+    parameters = getZapParameters(input_soundwave, channels, engine, constants, filePath, light_table)
+
+    arrays = zap_cache.getOrCompute(parameters, lambda: zap(input_soundwave, channels, engine))
+
+    #leave the M13 in the same state as zap() would (the scripts read its voltage for labels)
+    bacteriophage.setUltrasound(input_soundwave, channels)
+    return arrays
+
+
+#zap() with the SER time step chosen from its time constant (see zap_engine.zapAutoDt), the outputs
+#are given on time_grid (S_array by default) and the chosen step is returned as a 4th value
+def zapAuto(input_soundwave, channels, time_grid=None, reset_tolerance=1E-3):
+
+    bacteriophage.setUltrasound(input_soundwave, channels)
+    if time_grid is None:
+        time_grid = S_array
+
+    return zapAutoDt(bacteriophage.getVoltage(), channels, Vrest, Vmax, time_grid, dt, calcium_model, photon_emiter, reset_tolerance)
+
+
+#streaming version of zap() for long runs (e.g. 100 ms): yields (time, Vt, Pout, light) chunks of
+#chunk_size samples in the same units as zap() without ever allocating the full arrays
+#(duration=None keeps streaming until the consumer stops)
+def zapStream(input_soundwave, channels, duration=S, chunk_size=1000000):
+
+    bacteriophage.setUltrasound(input_soundwave, channels)
+    n_steps = None if duration is None else int(round(duration/dt))
+
+    return zapChunks(bacteriophage.getVoltage(), channels, Vrest, Vmax, dt, n_steps, calcium_model, photon_emiter, chunk_size)
+
+
+#runs zapStream() and writes the traces to a directory on disk instead of keeping them in RAM
+#(open them lazily with trace_store.openTraces(directory))
+def zapToDisk(input_soundwave, channels, directory, duration=S, chunk_size=1000000):
+
+    parameters = {'input_soundwave': input_soundwave, 'channels': channels, 'Pout': Pout,
+                  'Vrest': Vrest, 'Vmax': Vmax, 'dt': dt, 'duration': duration}
+
+    return zapToStore(zapStream(input_soundwave, channels, duration, chunk_size), directory, dt, parameters)
+
 #this function gets the highest blue light intensity values in the light_array
 #it then takes the average of these values (which will be used for the neuron component)
 def avg_light_intensity(blue_light_array):
-    #sort the array, in ascending order
-    temp = array(blue_light_array)
-    temp[::-1].sort()
-
     #gets the number of indexes to use in the average calculation(top 5% for for this case)
     cut_off = 5 #(percentage) - change as needed
-    treshold = (cut_off*len(temp))//100
-    print(len(blue_light_array))
-    print(treshold)
-
-    #iterates through the top 10% values and calculates the average
-    avg = 0
-    for x in range(treshold):
-        avg += temp[x]
-    
-    return avg/treshold
+
+    #same average as the batch pipeline (see zap_engine.averageTopLight)
+    return averageTopLight(blue_light_array, cut_off)
 
 # =============================================================================
 # Neuron Component
@@ -145,17 +215,21 @@ sim_time = 600.0
 # simulate consecutive light pulses by setting single_pulse to False, not incorportated into control panel
 init_pulse_times = [0, 20, 40]
 init_pulse_widths = [6, 6, 6]
-pulse_times = copy.copy(init_pulse_times)
-pulse_widths = copy.copy(init_pulse_widths)
 single_pulse = True
 
 light_delay = 100 # ms
 pulse_width = 400 # ms
 light_intensity = 5.5 # mW/mm^2
 wavelength = 470 # nm
-if not single_pulse:
-    light_delay = pulse_times.pop(0)
-    pulse_width = pulse_widths.pop(0)
+
+# jump over dark intervals in which the neuron is at rest instead of stepping every dt
+fast_forward_enabled = True
+
+# physics steps per rendered frame, None fits as many as target_fps allows; sim_speed caps the
+# simulated ms per second (1000.0 is real time, None as fast as the frame rate allows)
+steps_per_frame = None
+target_fps = 30.0
+sim_speed = None
 
 # =============================================================================
 # Initialize Graphs
@@ -209,6 +283,15 @@ w_loss = 1.3
 T_ChR2 = 1.3
 four_state_model = FourStateModel(gamma, Gd2, ep1, ep2, sigma_ret, w_loss, T_ChR2)
 
+# =============================================================================
+# Trace Recorders - only the last trace_capacity samples are kept, so memory
+# stays flat however long the interactive session runs
+# =============================================================================
+trace_capacity = 100000
+izhikevich.setRecorder('v', RingRecorder(trace_capacity))
+izhikevich.setRecorder('spike_times', RingRecorder(trace_capacity))
+four_state_model.setRecorder('I', RingRecorder(trace_capacity))
+
 # =============================================================================
 # Create Channelrhodopsin Object
 # =============================================================================
@@ -223,6 +306,56 @@ ChR2 = Channelrhodopsin(four_state_model, dt_neuron, E_ChR2, g_ChR2, wavelength,
 soma_radius = 18
 neuron = Neuron(soma_radius, izhikevich, ChR2)
 
+# =============================================================================
+# Light Protocol & the headless simulation that advances the models, the loop
+# below only draws what it computes
+# =============================================================================
+def getLightProtocol():
+    if single_pulse:
+        return LightProtocol([light_delay], [pulse_width], light_intensity)
+    else:
+        return LightProtocol(init_pulse_times, init_pulse_widths, light_intensity)
+
+light_protocol = getLightProtocol()
+runner = HeadlessSimulation(izhikevich, ChR2, light_protocol, dt_neuron, fast_forward_enabled)
+scheduler = FrameScheduler(dt_neuron, steps_per_frame, target_fps, sim_speed)
+
+# =============================================================================
+# Graph Recording - samples reach the graphs through a recording policy
+# ('full', ('decimate', k) or ('envelope', k), see downsample.py), by default
+# a min/max envelope with about one bin per pixel column of the graphs
+# =============================================================================
+graph_width = 550
+graph_recording = None # None picks the envelope from sim_time and graph_width
+
+# what the recorders emit during a frame is plotted in one call per curve, see drawGraphs
+ChR2_buffer = PlotBuffer(dt_neuron)
+neuron_buffer = PlotBuffer(dt_neuron)
+light_buffer = PlotBuffer(dt_neuron)
+
+def getGraphRecorders():
+    recording = graph_recording or envelopeForPixels(sim_time/dt_neuron, graph_width)
+    
+    # the gcurves keep the points, the recorders only hold the last few
+    def graphRecorder(buffer):
+        buffer.clear()
+        return makeRecorder(recording, RingRecorder(4*graph_width), RingRecorder(4*graph_width, int), buffer.add)
+    
+    return (graphRecorder(ChR2_buffer), graphRecorder(neuron_buffer), graphRecorder(light_buffer))
+
+# plot the partially filled envelope bins at the end of the run
+def flushGraphs():
+    for recorder in (ChR2_recorder, neuron_recorder, light_recorder):
+        recorder.flush()
+
+# plot the samples of the last frame, the curves are replaced on reset so they are looked up here
+def drawGraphs():
+    ChR2_buffer.flush(ChR2_plot)
+    neuron_buffer.flush(neuron_plot)
+    light_buffer.flush(light_plot)
+
+ChR2_recorder, neuron_recorder, light_recorder = getGraphRecorders()
+
 # =============================================================================
 # Display for current time & membrane potential
 # =============================================================================
@@ -235,15 +368,7 @@ V_display = label( pos=vec(10,40,0),
 # Return the current Light Intensity
 # =============================================================================
 def getIrradiance():
-    global pulse_times, pulse_widths, light_delay, pulse_width, average_Intensity
-    if (not single_pulse) and (len(pulse_times) > 0):
-        if (t > (light_delay + pulse_width)):
-            light_delay = pulse_times.pop(0)
-            pulse_width = pulse_widths.pop(0)
-    if (t < light_delay) or (t > (light_delay + pulse_width)):
-        return 0
-    else:
-        return light_intensity
+    return light_protocol.getIrradiance(t)
     
 # =============================================================================
 # Light Source - for visual representation of input
@@ -259,6 +384,7 @@ light_source = local_light(pos=vector(0,0,(neuron.soma.radius*-1)+100),
 def toggleSim(b):
     global running
     running = not running
+    scheduler.reset()
     if running:
         b.text = 'Stop'
     else:
@@ -268,22 +394,19 @@ button_start = button(text='Start', pos=scene.title_anchor, bind=toggleSim)
 
 # reset the simulation
 def resetSim(b):
-    global t, izhikevich, ChR2, neuron, four_state_model, running, ChR2_graph, ChR2_plot, light_graph, light_plot, neuron_graph, neuron_plot, pulse_times, pulse_widths, light_delay, pulse_width
+    global t, izhikevich, ChR2, neuron, four_state_model, running, ChR2_graph, ChR2_plot, light_graph, light_plot, neuron_graph, neuron_plot, light_protocol, runner, ChR2_recorder, neuron_recorder, light_recorder
     if running:
         running = not running
         button_start.text = 'Start'
     t = 0.0
     
-    if not single_pulse:
-        pulse_times = copy.copy(init_pulse_times)
-        pulse_widths = copy.copy(init_pulse_widths)
-        light_delay = pulse_times.pop(0)
-        pulse_width = pulse_widths.pop(0)
-    
     izhikevich.reset()
     four_state_model.reset()
     ChR2.reset(four_state_model, wavelength, holding_potential)
     neuron.reset(izhikevich, ChR2)
+    light_protocol = getLightProtocol()
+    runner = HeadlessSimulation(izhikevich, ChR2, light_protocol, dt_neuron, fast_forward_enabled)
+    ChR2_recorder, neuron_recorder, light_recorder = getGraphRecorders()
     V_display.text = 'Membrane Potential: ' + str(neuron.getMembraneModel().getMembranePotential()) + ' mV \nTime: ' + str(t) + ' ms'
     light_source.visible = False
 
@@ -396,23 +519,37 @@ number_channels = 1000
 soundwave_intensity = 2.0
 
 #run zap() -> get output 
-(Vt_arr, extra_conc_arr, light_arr) = zap(soundwave_intensity, number_channels)
+(Vt_arr, extra_conc_arr, light_arr) = cachedZap(soundwave_intensity, number_channels)
 
 #get M13's volatge (for graph labels)
 v = bacteriophage.getVoltage()*1000
 
 light_intensity = avg_light_intensity(light_arr)
 print(light_intensity)
+light_protocol.light_intensity = light_intensity
 
 #displays the caculated average light intensity generated by the bubble
 scene.append_to_caption('\nAverage Maximum Blue Light intensity: '+str(round(light_intensity,3)) + ' mW/mm^2\n') 
 
+#the bubble traces go to their graphs in one plot() call each, reduced to about one point
+#per pixel column so startup does not depend on S: 'envelope' keeps the min and max of
+#every column, 'lttb' one point per column (see downsample.py)
+bubble_graph_width = 640 #vpython's default graph width
+bubble_graph_method = 'envelope'
+
+def plotTrace(curve, values):
+    if bubble_graph_method == 'lttb':
+        policy = lttbForPixels(len(values), bubble_graph_width)
+    else:
+        policy = envelopeForPixels(len(values), bubble_graph_width)
+    indices, kept = downsample(values, policy)
+    curve.plot(list(zip(S_array[indices].tolist(), kept.tolist())))
+
 # Add points to the curve of the membrane potential, extracellular concentration, 
 # and blue light intensity graphs using the caculates arrays by the zap function
-for i in range(len(S_array)):
-    membrane_plot.plot(pos=(S_array[i], Vt_arr[i]))
-    extracellular_plot.plot(pos=(S_array[i], extra_conc_arr[i]))
-    blue_plot.plot(pos=(S_array[i], light_arr[i]))
+plotTrace(membrane_plot, Vt_arr)
+plotTrace(extracellular_plot, extra_conc_arr)
+plotTrace(blue_plot, light_arr)
 
 #initializes the last 3 graphs for the neuron
 ChR2_plot.plot([0,0])
@@ -420,23 +557,53 @@ neuron_plot.plot([0,0])
 light_plot.plot([0,0])
 
 # =============================================================================
-# Loop running the simulation
+# Draw a frame - the label, the light source, the neuron and the graphs are
+# only updated once per frame, not after every time step
+# =============================================================================
+def drawFrame():
+    light_source.visible = getIrradiance() > 0
+    neuron.updateVisuals()
+    V_display.text = 'Membrane Potential: ' + str(neuron.getMembraneModel().getMembranePotential()) + ' mV \nTime: ' + str(t) + ' ms'
+    drawGraphs()
+
+# =============================================================================
+# Loop running the simulation, a batch of time steps per rendered frame
+# (see frame_scheduler.py)
 # =============================================================================
 while True:
     while t < sim_time:
         if running:
-            neuron.nextTimeStep(t, getIrradiance())
-                
-            if getIrradiance() > 0:
-                light_source.visible = True
-            else:
-                light_source.visible = False
+            steps = scheduler.startFrame()
+            done = 0
+            stepped = 0
+            I_frame, v_frame, light_frame = [], [], []
+            while done < steps and t < sim_time:
+                skipped = runner.skip(t, min(t + (steps - done)*dt_neuron, sim_time))
+                if skipped is not None:
+                    # the skipped samples are only computed here, for the graphs
+                    I_frame.extend(skipped.getPhotocurrents().tolist())
+                    v_frame.extend(skipped.getMembranePotentials().tolist())
+                    light_frame.extend(skipped.getIrradiances().tolist())
+                    t = skipped.end_time
+                    done += skipped.n_steps
+                    continue
                 
-            V_display.text = 'Membrane Potential: ' + str(neuron.getMembraneModel().getMembranePotential()) + ' mV \nTime: ' + str(t) + ' ms'
+                runner.step(t)
+                I_frame.append(ChR2.getI())
+                v_frame.append(izhikevich.getMembranePotential())
+                light_frame.append(getIrradiance())
+                t += dt_neuron
+                done += 1
+                stepped += 1
+            scheduler.physicsDone(stepped)
             
-            # update graphs in real time
-            ChR2_plot.plot([t, neuron.getOpsinModel().getI()])
-            neuron_plot.plot([t, neuron.getMembraneModel().getMembranePotential()])
-            light_plot.plot([t,getIrradiance()])
+            # update graphs once per frame
+            ChR2_recorder.extend(I_frame)
+            neuron_recorder.extend(v_frame)
+            light_recorder.extend(light_frame)
+            if t >= sim_time:
+                flushGraphs()
             
-            t += dt_neuron
\ No newline at end of file
+            drawFrame()
+            scheduler.endFrame()
+            rate(target_fps)
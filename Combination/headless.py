@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless neuron simulation, no vpython
+
+Builds the Izhikevich, four-state ChR2 and Channelrhodopsin models, runs a
+light protocol to the end as fast as the CPU allows and returns the traces as
+NumPy arrays. main.py is a viewer on top of HeadlessSimulation: it calls the
+same step() and skip() and only adds the graphs and the 3D neuron.
+
+    results = runProtocol(light_intensity=2.0, sim_time=1000.0)
+    results['t'], results['v'], results['I'], results['irradiance'], results['spike_times']
+
+With fast_forward_enabled=False every step is taken and the traces match the
+old main.py loop sample for sample. With fast-forward (the default, as in
+main.py) t lands exactly on the light edges, while the stepped loop's
+float-accumulated t reaches e.g. 100 ms as 99.99999999 and turns the light on
+one step late, so spikes come about one dt (0.02 ms) earlier than in the loop.
+
+"""
+from izhikevich import Izhikevich
+from channelrhodopsin import Channelrhodopsin
+from four_state_model import FourStateModel
+from simulation import LightProtocol, FastForward
+from recorder import ChunkedRecorder
+
+# same values as main.py
+default_parameters = {
+    # simulation
+    'dt': 0.02, # ms
+    'sim_time': 600.0, # ms
+    # light protocol, consecutive pulses when single_pulse is False
+    'single_pulse': True,
+    'light_delay': 100, # ms
+    'pulse_width': 400, # ms
+    'init_pulse_times': [0, 20, 40],
+    'init_pulse_widths': [6, 6, 6],
+    'light_intensity': 5.5, # mW/mm^2
+    'wavelength': 470, # nm
+    # Izhikevich model
+    'iz_a': 0.02,
+    'iz_b': 0.2,
+    'iz_c': -65,
+    'iz_d': 8,
+    'ap_threshold': 30.0,
+    # four-state ChR2 model
+    'gamma': 0.1,
+    'Gd2': 0.05,
+    'ep1': 0.8535,
+    'ep2': 0.14,
+    'sigma_ret': 12*(10**-20),
+    'w_loss': 1.3,
+    'T_ChR2': 1.3,
+    # channelrhodopsin
+    'E_ChR2': 0.0,
+    'g_ChR2': 2.0/5,
+    'holding_potential': -70.0, # mV
+    'Vclamp': True,
+    # jump over dark intervals in which the neuron is at rest
+    'fast_forward_enabled': True,
+}
+
+# default_parameters updated with the given ones, unknown names raise a ValueError
+def getParameters(overrides=None):
+    parameters = dict(default_parameters)
+    for name, value in (overrides or {}).items():
+        if name not in parameters:
+            raise ValueError("unknown parameter: " + str(name))
+        parameters[name] = value
+    return parameters
+
+# (izhikevich, four_state_model, ChR2) for a parameter dict
+def buildModels(parameters):
+    p = parameters
+    izhikevich = Izhikevich(p['dt'], p['iz_a'], p['iz_b'], p['iz_c'], p['iz_d'], p['ap_threshold'])
+    four_state_model = FourStateModel(p['gamma'], p['Gd2'], p['ep1'], p['ep2'], p['sigma_ret'], p['w_loss'], p['T_ChR2'])
+    ChR2 = Channelrhodopsin(four_state_model, p['dt'], p['E_ChR2'], p['g_ChR2'], p['wavelength'], p['holding_potential'], p['Vclamp'])
+    return (izhikevich, four_state_model, ChR2)
+
+def getLightProtocol(parameters):
+    p = parameters
+    if p['single_pulse']:
+        return LightProtocol([p['light_delay']], [p['pulse_width']], p['light_intensity'])
+    else:
+        return LightProtocol(p['init_pulse_times'], p['init_pulse_widths'], p['light_intensity'])
+
+class HeadlessSimulation:
+    def __init__(self, membrane_model, opsin, protocol, dt, fast_forward_enabled=True):
+        # Izhikevich membrane model, Channelrhodopsin and simulation.LightProtocol
+        self.membrane_model = membrane_model
+        self.opsin = opsin
+        self.protocol = protocol
+        self.dt = dt
+        self.fast_forward_enabled = fast_forward_enabled
+        self.fast_forward = FastForward(membrane_model, opsin, protocol, dt)
+
+    def getIrradiance(self, t):
+        return self.protocol.getIrradiance(t)
+
+    # one time step starting at t, same order as Neuron.nextTimeStep
+    def step(self, t):
+        self.opsin.nextTimeStep(self.membrane_model.getMembranePotential(), self.getIrradiance(t))
+        self.membrane_model.updateMembranePotential(t, abs(self.opsin.getI()))
+
+    # jumps over the quiescent interval starting at t if there is one and returns it as a
+    # simulation.SkippedInterval, otherwise returns None and t has to be stepped
+    def skip(self, t, end_time):
+        if not self.fast_forward_enabled:
+            return None
+        return self.fast_forward.skip(t, end_time)
+
+    # runs from t to end_time, returns a dict of arrays: the step times 't' and after every
+    # step the membrane potential 'v', the photocurrent 'I' and the 'irradiance', plus the
+    # 'spike_times' from t on
+    def run(self, end_time, t=0.0):
+        times = ChunkedRecorder()
+        potentials = ChunkedRecorder()
+        currents = ChunkedRecorder()
+        irradiances = ChunkedRecorder()
+        t_start = t
+
+        while t < end_time:
+            skipped = self.skip(t, end_time)
+            if skipped is not None:
+                times.extend(skipped.getTimes())
+                potentials.extend(skipped.getMembranePotentials())
+                currents.extend(skipped.getPhotocurrents())
+                irradiances.extend(skipped.getIrradiances())
+                t = skipped.end_time
+                continue
+
+            self.step(t)
+            times.append(t)
+            potentials.append(self.membrane_model.getMembranePotential())
+            currents.append(self.opsin.getI())
+            irradiances.append(self.getIrradiance(t))
+            t += self.dt
+
+        spike_times = self.membrane_model.spike_times.view()
+        return {'t': times.view(),
+                'v': potentials.view(),
+                'I': currents.view(),
+                'irradiance': irradiances.view(),
+                'spike_times': spike_times[spike_times >= t_start]}
+
+# builds the models from default_parameters updated with the given ones, runs the light
+# protocol for sim_time and returns the traces (see HeadlessSimulation.run); pass
+# fast_forward_enabled=False to reproduce the stepped loop exactly (see above)
+def runProtocol(**overrides):
+    parameters = getParameters(overrides)
+    izhikevich, four_state_model, ChR2 = buildModels(parameters)
+    simulation = HeadlessSimulation(izhikevich, ChR2, getLightProtocol(parameters), parameters['dt'],
+                                    parameters['fast_forward_enabled'])
+    return simulation.run(parameters['sim_time'])
@@ -8,7 +8,7 @@ Created on Thu Nov  3 14:10:44 2022
 
 """
 import math
-import matplotlib.pyplot as plt
+from recorder import ChunkedRecorder
 
 class Izhikevich:
     
@@ -38,12 +38,19 @@ class Izhikevich:
         
         self.I = 0.0
 
-        self.vs = []
-        self.spike_times = []
+        # recorders of v (before every step) and of the spike times, see setRecorder
+        self.vs = ChunkedRecorder()
+        self.spike_times = ChunkedRecorder(1024)
         
         self.spiked = False
         self.converged = False
         
+        # when True v is advanced with the exact solution of its quadratic equation within
+        # every step (u held at its value at the start of the step), spikes are timed at the
+        # threshold crossing inside the step and the reset is applied there, so spike
+        # latencies stay accurate at a much coarser dt
+        self.interpolate_spikes = False
+        
     def reset(self):
         # membrane potential, initially equal to the stable resting potential
         self.v = self.v_rest_minus
@@ -53,8 +60,8 @@ class Izhikevich:
         
         self.I = 0.0
 
-        self.vs = []
-        self.spike_times = []
+        self.vs.clear()
+        self.spike_times.clear()
         
         self.spiked = False
         self.converged = False
@@ -65,6 +72,11 @@ class Izhikevich:
     def updateMembranePotential(self, t, I):
         self.vs.append(self.v)
         
+        if self.interpolate_spikes:
+            self.advanceWithinStep(t, I)
+            self.checkConvergence()
+            return
+        
         dv = (0.04 * self.v ** 2) + (5.0 * self.v) + 140.0 - self.u + I
         du = self.a * ((self.b * self.v) - self.u)
             
@@ -82,12 +94,87 @@ class Izhikevich:
             self.v = self.c
             self.u = self.u + self.d
         
-        # check if membrane potential has converged to resting potential
+        self.checkConvergence()
+    
+    # one time step with the spikes located inside the step, a coarse step can hold several spikes
+    def advanceWithinStep(self, t, I):
+        elapsed = 0.0
+        while True:
+            remaining = self.dt - elapsed
+            crossing = self.getCrossingTime(self.v, self.u, I)
+            if crossing > remaining:
+                self.v, integral = self.solveQuadratic(self.v, self.u, I, remaining)
+                self.u += self.a * ((self.b * integral) - (self.u * remaining))
+                return
+            
+            #spike
+            self.spike_times.append(t + elapsed + crossing)
+            self.spiked = True
+            
+            #reset at the crossing
+            integral = self.solveQuadratic(self.v, self.u, I, crossing)[1]
+            self.u += (self.a * ((self.b * integral) - (self.u * crossing))) + self.d
+            self.v = self.c
+            elapsed += crossing
+    
+    # v after a time h of dv/dt = 0.04v^2 + 5v + 140 - u + I with u and I constant, and the
+    # integral of v over that time (for the update of u); h must end before v blows up
+    def solveQuadratic(self, v, u, I, h):
+        discriminant = 25.0 - (0.16 * (140.0 - u + I))
+        if discriminant < 0:
+            # v = (w tan(w t + x0) - 2.5)/0.04
+            w = math.sqrt(-discriminant)/2
+            x0 = math.atan(((0.04 * v) + 2.5)/w)
+            x = x0 + (w * h)
+            return ((w * math.tan(x)) - 2.5)/0.04, (-62.5 * h) + (math.log(math.cos(x0)/math.cos(x))/0.04)
+        if discriminant == 0:
+            # single root at -62.5
+            return -62.5 + ((v + 62.5)/(1 - (0.04 * (v + 62.5) * h))), (-62.5 * h) - (math.log(abs(1 - (0.04 * (v + 62.5) * h)))/0.04)
+        
+        # roots r1 < r2, v moves away from r2 and towards r1
+        s = math.sqrt(discriminant)
+        r1 = (-5.0 - s)/0.08
+        r2 = (-5.0 + s)/0.08
+        if v == r1:
+            return v, v * h
+        K = (v - r2)/(v - r1)
+        E = K * math.exp(s * h)
+        return (r2 - (E * r1))/(1 - E), (r2 * h) - (math.log(abs((1 - E)/(1 - K)))/0.04)
+    
+    # time until v reaches v_thresh under the same equation, inf if it never does
+    def getCrossingTime(self, v, u, I):
+        if v >= self.v_thresh:
+            return 0.0
+        discriminant = 25.0 - (0.16 * (140.0 - u + I))
+        if discriminant < 0:
+            w = math.sqrt(-discriminant)/2
+            return max((math.atan(((0.04 * self.v_thresh) + 2.5)/w) - math.atan(((0.04 * v) + 2.5)/w))/w, 0.0)
+        if discriminant == 0:
+            if v <= -62.5:
+                return math.inf
+            return max(((1/(v + 62.5)) - (1/(self.v_thresh + 62.5)))/0.04, 0.0)
+        
+        s = math.sqrt(discriminant)
+        r1 = (-5.0 - s)/0.08
+        r2 = (-5.0 + s)/0.08
+        if v <= r2:
+            return math.inf
+        return max(math.log(((self.v_thresh - r2)/(self.v_thresh - r1))/((v - r2)/(v - r1)))/s, 0.0)
+    
+    # check if membrane potential has converged to resting potential
+    def checkConvergence(self):
         percent_difference = (abs(abs(self.v) - abs(self.v_rest_minus)))/((abs(self.v) + abs(self.v_rest_minus))/2) * 100
         if percent_difference <= 0.5:
             self.converged = True
         else:
             self.converged = False
+    
+    # set v and u directly, e.g. after an interval advanced by simulation.FastForward
+    def setState(self, v, u, I):
+        self.v = v
+        self.u = u
+        self.I = I
+        self.checkConvergence()
         
     def hasSpiked(self):
         return self.spiked
@@ -112,8 +199,27 @@ class Izhikevich:
     def getRestingPotential(self):
         return self.v_rest_minus
     
+    # attach a recorder (recorder.RingRecorder, recorder.ChunkedRecorder or
+    # trace_store.TraceWriter) to 'v' or 'spike_times'
+    def setRecorder(self, variable, recorder):
+        if variable == 'v':
+            self.vs = recorder
+        elif variable == 'spike_times':
+            self.spike_times = recorder
+        else:
+            raise ValueError("unknown variable: " + str(variable))
+    
+    def setTraceWriter(self, writer):
+        self.setRecorder('v', writer)
+    
+    # append values of v computed elsewhere (e.g. a fast-forwarded interval) to the trace
+    def extendTrace(self, values):
+        self.vs.extend(values)
+    
     def getPlot(self):
+        # matplotlib is only imported here, the model itself needs nothing but NumPy
+        import matplotlib.pyplot as plt
         fig = plt.figure(figsize=(12,9), dpi=180)
-        plt.plot(self.vs)
+        plt.plot(self.vs.view())
         plt.show()
     
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized Izhikevich model for a population of neurons
+
+Same update rule as izhikevich.py, but v, u, I and the parameters
+(a, b, c, d, ap_threshold) are NumPy arrays so thousands of neurons with
+heterogeneous parameters are advanced with one set of array operations per step.
+
+"""
+import numpy as np
+
+# (a, b, c, d) presets from Izhikevich (2003)
+presets = {'regular_spiking': (0.02, 0.2, -65.0, 8.0),
+           'fast_spiking':    (0.1,  0.2, -65.0, 2.0),
+           'chattering':      (0.02, 0.2, -50.0, 2.0)}
+
+class IzhikevichPopulation:
+
+    def __init__(self, time_step, time_scale, sensitivity, potential_reset, recovery_reset, ap_threshold, size=None):
+        self.dt = time_step
+
+        # parameters are broadcast to one value per neuron
+        if size is None:
+            size = np.broadcast(np.asarray(time_scale), np.asarray(sensitivity), np.asarray(potential_reset),
+                                np.asarray(recovery_reset), np.asarray(ap_threshold)).size
+        self.size = size
+
+        # time scale of recovery variable u
+        self.a = np.broadcast_to(np.asarray(time_scale, dtype=float), (size,)).copy()
+        # sensitivity of u to the fluctuations in v
+        self.b = np.broadcast_to(np.asarray(sensitivity, dtype=float), (size,)).copy()
+        # after-spike reset value of v
+        self.c = np.broadcast_to(np.asarray(potential_reset, dtype=float), (size,)).copy()
+        # after-spike reset value of u
+        self.d = np.broadcast_to(np.asarray(recovery_reset, dtype=float), (size,)).copy()
+
+        # stable resting potential of every neuron
+        self.v_rest_minus = (12.5 * self.b) - 62.5 - (12.5 * np.sqrt((self.b ** 2) - (10 * self.b) + 2.6))
+
+        # action potential firing threshold
+        self.v_thresh = np.broadcast_to(np.asarray(ap_threshold, dtype=float), (size,)).copy()
+
+        # advance v exactly within the step and time spikes at the threshold crossing (see Izhikevich)
+        self.interpolate_spikes = False
+
+        self.reset()
+
+    # build a population from preset names, e.g. ['regular_spiking']*800 + ['fast_spiking']*200
+    @classmethod
+    def fromPresets(cls, time_step, preset_names, ap_threshold=30.0):
+        a, b, c, d = np.array([presets[name] for name in preset_names], dtype=float).T
+        return cls(time_step, a, b, c, d, ap_threshold)
+
+    def reset(self):
+        # membrane potential, initially equal to the stable resting potential
+        self.v = self.v_rest_minus.copy()
+
+        # membrane recovery variable
+        self.u = self.b*self.v
+
+        self.I = np.zeros(self.size)
+
+        # spikes are stored per step as (neuron indices, time) and joined on request
+        self.spike_indices = []
+        self.spike_times = []
+
+        self.spiked = np.zeros(self.size, dtype=bool)
+        self.converged = np.zeros(self.size, dtype=bool)
+
+    def getRestingPotential(self):
+        return self.v_rest_minus
+
+    # advance every neuron by one time step, I is a scalar or one current per neuron
+    def updateMembranePotential(self, t, I):
+        self.I = np.broadcast_to(np.asarray(I, dtype=float), (self.size,))
+
+        if self.interpolate_spikes:
+            self.advanceWithinStep(t)
+            self.checkConvergence()
+            return
+
+        dv = (0.04 * self.v ** 2) + (5.0 * self.v) + 140.0 - self.u + self.I
+        du = self.a * ((self.b * self.v) - self.u)
+
+        # apply changes multiplied by the time step
+        self.v += dv * self.dt
+        self.u += du * self.dt
+
+        # detect spikes and reset only the neurons that crossed their threshold
+        fired = self.v >= self.v_thresh
+        if fired.any():
+            index = np.flatnonzero(fired)
+            self.spike_indices.append(index)
+            self.spike_times.append(np.full(len(index), t))
+            self.spiked |= fired
+
+            self.v[fired] = self.c[fired]
+            self.u[fired] += self.d[fired]
+
+        self.checkConvergence()
+
+    # one time step with the spikes located inside the step, only the neurons that spiked
+    # are advanced again over the rest of the step
+    def advanceWithinStep(self, t):
+        elapsed = np.zeros(self.size)
+        active = np.arange(self.size)
+        while len(active):
+            v = self.v[active]
+            u = self.u[active]
+            I = self.I[active]
+            remaining = self.dt - elapsed[active]
+            crossing = self.getCrossingTime(v, u, I, self.v_thresh[active])
+            fired = crossing <= remaining
+            h = np.where(fired, crossing, remaining)
+
+            v_end, integral = self.solveQuadratic(v, u, I, h)
+            self.u[active] = u + (self.a[active] * ((self.b[active] * integral) - (u * h))) + np.where(fired, self.d[active], 0.0)
+            self.v[active] = np.where(fired, self.c[active], v_end)
+
+            if fired.any():
+                index = active[fired]
+                self.spike_indices.append(index)
+                self.spike_times.append(t + elapsed[index] + crossing[fired])
+                self.spiked[index] = True
+
+            elapsed[active] += h
+            active = active[fired]
+
+    # v after a time h of dv/dt = 0.04v^2 + 5v + 140 - u + I with u and I constant, and the
+    # integral of v over that time, for every neuron (see Izhikevich.solveQuadratic)
+    def solveQuadratic(self, v, u, I, h):
+        discriminant = 25.0 - (0.16 * (140.0 - u + I))
+        s = np.sqrt(np.abs(discriminant))
+        with np.errstate(all='ignore'):
+            # complex roots
+            w = s/2
+            x0 = np.arctan(((0.04 * v) + 2.5)/w)
+            x = x0 + (w * h)
+            v_complex = ((w * np.tan(x)) - 2.5)/0.04
+            integral_complex = (-62.5 * h) + (np.log(np.cos(x0)/np.cos(x))/0.04)
+
+            # real roots r1 < r2
+            r1 = (-5.0 - s)/0.08
+            r2 = (-5.0 + s)/0.08
+            K = (v - r2)/(v - r1)
+            E = K * np.exp(s * h)
+            v_real = np.where(v == r1, v, (r2 - (E * r1))/(1 - E))
+            integral_real = np.where(v == r1, v * h, (r2 * h) - (np.log(np.abs((1 - E)/(1 - K)))/0.04))
+
+            # single root at -62.5
+            v_single = -62.5 + ((v + 62.5)/(1 - (0.04 * (v + 62.5) * h)))
+            integral_single = (-62.5 * h) - (np.log(np.abs(1 - (0.04 * (v + 62.5) * h)))/0.04)
+
+        conditions = [discriminant < 0, discriminant > 0]
+        return (np.select(conditions, [v_complex, v_real], v_single),
+                np.select(conditions, [integral_complex, integral_real], integral_single))
+
+    # time until v reaches v_thresh under the same equation, inf where it never does
+    def getCrossingTime(self, v, u, I, v_thresh):
+        discriminant = 25.0 - (0.16 * (140.0 - u + I))
+        s = np.sqrt(np.abs(discriminant))
+        with np.errstate(all='ignore'):
+            w = s/2
+            time_complex = (np.arctan(((0.04 * v_thresh) + 2.5)/w) - np.arctan(((0.04 * v) + 2.5)/w))/w
+
+            r1 = (-5.0 - s)/0.08
+            r2 = (-5.0 + s)/0.08
+            time_real = np.where(v > r2, np.log(((v_thresh - r2)/(v_thresh - r1))/((v - r2)/(v - r1)))/s, np.inf)
+
+            time_single = np.where(v > -62.5, ((1/(v + 62.5)) - (1/(v_thresh + 62.5)))/0.04, np.inf)
+
+        time = np.select([discriminant < 0, discriminant > 0], [time_complex, time_real], time_single)
+        return np.where(v >= v_thresh, 0.0, np.maximum(time, 0.0))
+
+    # check if membrane potential has converged to resting potential
+    def checkConvergence(self):
+        percent_difference = (np.abs(np.abs(self.v) - np.abs(self.v_rest_minus)))/((np.abs(self.v) + np.abs(self.v_rest_minus))/2) * 100
+        self.converged = percent_difference <= 0.5
+
+    # spikes so far as two arrays: (neuron_index, time)
+    def getSpikes(self):
+        if not self.spike_indices:
+            return (np.empty(0, dtype=int), np.empty(0))
+        return (np.concatenate(self.spike_indices), np.concatenate(self.spike_times))
+
+    def hasSpiked(self):
+        return self.spiked
+
+    def isSpiking(self):
+        self.spiked &= ~(self.v <= self.v_rest_minus)
+        return self.v >= -55
+
+    def isConverged(self):
+        return self.converged
+
+    def getMembranePotential(self):
+        return self.v
@@ -0,0 +1,129 @@
+"""
+Precomputed Vt -> (Pout, light intensity) transfer table
+
+For fixed calcium and photon emission parameters the chain
+CalciumCluster.updateConcentrations(Vt) -> PhotonEmission.getLightIntensity(Pout, dt)
+is a scalar function of the SER voltage. The table samples it once on a uniform
+voltage grid between Vrest and Vmax and maps voltages to outputs by linear
+interpolation. The grid is refined until the interpolation error measured at
+the midpoints between samples is below the requested tolerance.
+"""
+import numpy as np
+
+
+class LightTransferTable:
+
+    def __init__(self, calcium_model, photon_emiter, Vrest, Vmax, dt, tolerance=1E-6, max_points=2**20):
+
+        self.calcium_model = calcium_model
+        self.photon_emiter = photon_emiter
+        self.Vrest = Vrest
+        self.Vmax = Vmax
+        self.dt = dt
+
+        #maximum interpolation error relative to the largest value in the table
+        self.tolerance = tolerance
+        self.max_points = max_points
+
+        #set by build(), parameters == None means the table has to be (re)built
+        self.parameters = None
+        self.max_error = None
+
+
+    #everything the sampled chain depends on, a change in any of these makes
+    #the table stale (checked on every lookup, so edits are picked up automatically)
+    def getParameters(self):
+        return (self.calcium_model.total_conc,
+                self.photon_emiter.diffusion_coef,
+                self.photon_emiter.radius,
+                self.photon_emiter.total_aequorin,
+                self.Vrest, self.Vmax, self.dt)
+
+
+    #exact chain for an array of voltages -> (Pout, light intensity)
+    def evaluate(self, Vt):
+
+        Pout_t = self.calcium_model.getExtraConcentrations(Vt)
+        return (Pout_t, self.photon_emiter.getLightIntensities(Pout_t, self.dt))
+
+
+    def build(self):
+
+        #the models are used for sampling only, keep their state as it was
+        calcium_state = dict(vars(self.calcium_model))
+        photon_state = dict(vars(self.photon_emiter))
+
+        points = 257
+        while True:
+            grid = np.linspace(self.Vrest, self.Vmax, points)
+            Pout_t, light = self.evaluate(grid)
+
+            #check the interpolation against the exact chain halfway between samples
+            middle = (grid[1:] + grid[:-1])/2
+            Pout_mid, light_mid = self.evaluate(middle)
+            error = max(np.max(np.abs((Pout_t[1:] + Pout_t[:-1])/2 - Pout_mid))/np.max(np.abs(Pout_t)),
+                        np.max(np.abs((light[1:] + light[:-1])/2 - light_mid))/np.max(np.abs(light)))
+
+            if error <= self.tolerance or 2*points - 1 > self.max_points:
+                break
+            points = 2*points - 1
+
+        vars(self.calcium_model).update(calcium_state)
+        vars(self.photon_emiter).update(photon_state)
+
+        self.step = (self.Vmax - self.Vrest)/(points - 1)
+        self.Pout_table = Pout_t
+        self.Pout_slope = np.append(np.diff(Pout_t), 0)
+        self.light_table = light
+        self.light_slope = np.append(np.diff(light), 0)
+        self.max_error = error
+        self.parameters = self.getParameters()
+
+        #plain lists are much faster than NumPy arrays for one value at a time
+        self.samples = list(zip(Pout_t.tolist(), self.Pout_slope.tolist(), light.tolist(), self.light_slope.tolist()))
+
+
+    #returns (Pout, light intensity) for every voltage in Vt (floats for a scalar Vt),
+    #voltages outside [Vrest, Vmax] (e.g. the step that crosses Vmax) use the exact chain
+    def lookup(self, Vt):
+
+        if self.parameters != self.getParameters():
+            self.build()
+
+        shape = np.shape(Vt)
+        Vt = np.array(Vt, dtype=float, ndmin=1)
+
+        #position on the grid, split into sample index and fraction
+        x = np.subtract(Vt, self.Vrest)
+        np.multiply(x, 1/self.step, out=x)
+        inside = (x >= 0) & (x <= len(self.Pout_table) - 1)
+        np.clip(x, 0, len(self.Pout_table) - 1, out=x)
+        i = x.astype(np.intp)
+        np.subtract(x, i, out=x)
+
+        Pout_t = self.Pout_table[i] + self.Pout_slope[i]*x
+        light = self.light_table[i] + self.light_slope[i]*x
+
+        if not inside.all():
+            Pout_t[~inside], light[~inside] = self.evaluate(Vt[~inside])
+
+        if shape == ():
+            return (float(Pout_t[0]), float(light[0]))
+        return (Pout_t, light)
+
+
+    #scalar version of lookup() for the stepping zap() loop
+    def lookupVoltage(self, Vt):
+
+        if self.parameters != self.getParameters():
+            self.build()
+
+        x = (Vt - self.Vrest)/self.step
+        i = int(x)
+        if x < 0 or i >= len(self.samples) - 1:
+            Pout_t, light = self.evaluate(np.array([Vt]))
+            return (float(Pout_t[0]), float(light[0]))
+
+        x -= i
+        (Pout_i, Pout_slope, light_i, light_slope) = self.samples[i]
+        return (Pout_i + Pout_slope*x, light_i + light_slope*x)
@@ -1,4 +1,5 @@
 from math import pi, factorial, exp
+import numpy as np
 
  
 def getProbabilityOfEmission(flux, t):
@@ -80,4 +81,25 @@ class PhotonEmission:
         return self.output_intensity
 
 
-    
\ No newline at end of file
+    #array version of getLightIntensity(), same chain of formulas applied
+    #to every concentration at once (state is left at the last value)
+    def getLightIntensities(self, concentrations, dt, out=None):
+
+        #flux per mole of ions
+        flux_per_conc = 4*pi*self.diffusion_coef*self.radius*6.02214076E23
+
+        #probability of no photons being emited: (1+C)*exp(-C) with C = flux*dt
+        minus_C = np.multiply(concentrations, -flux_per_conc*dt)
+        prob_no_emission = np.exp(minus_C, out=out)
+        np.subtract(1, minus_C, out=minus_C)
+        np.multiply(prob_no_emission, minus_C, out=prob_no_emission)
+
+        #rate = flux/3*(1-prob) -> total emission per dt -> light intensity
+        output_intensity = np.subtract(1, prob_no_emission, out=prob_no_emission)
+        np.multiply(output_intensity, concentrations, out=output_intensity)
+        np.multiply(output_intensity, flux_per_conc * (self.total_aequorin / 6.02214076E23) * 249222.0104166667 / 3, out=output_intensity)
+
+        if output_intensity.size > 0:
+            self.getLightIntensity(np.asarray(concentrations).flat[-1], dt)
+
+        return output_intensity
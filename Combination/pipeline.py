@@ -0,0 +1,187 @@
+"""
+Batch entry point for the combined bubble -> neuron pipeline, no vpython
+
+Runs M13 -> SER -> calcium -> photon emission -> average light intensity ->
+ChR2 -> Izhikevich for one or many configurations, writes the results to
+disk and exits:
+
+    python pipeline.py run config.json [more.json ...] [-o results] [-j 4]
+
+A config file holds one configuration or a list of them. Every configuration
+is {"name": ..., "bubble": {...}, "neuron": {...}}; the bubble entries override
+bubble_defaults below (same values as combined.py) and the neuron entries
+override headless.default_parameters, anything left out keeps its default.
+The neuron's light intensity always comes from the bubble.
+
+Every configuration gets a directory <output>/<name> with
+    bubble/     Vt, Pout and light traces (trace_store format, openTraces())
+    neuron/     v, I and irradiance traces and the spike times
+    summary.json    the configuration, the light intensity handed to the
+                    neuron, spike count, first spike latency and run time
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from calcium import CalciumCluster
+from photon_emission import PhotonEmission
+from M13 import M13Phage
+from trace_store import TraceStore, openTraces
+from zap_engine import averageTopLight, zapChunks, zapToStore
+from headless import HeadlessSimulation, buildModels, getLightProtocol, getParameters
+
+
+#same values as combined.py
+bubble_defaults = {
+    'soundwave_intensity': 2.0,
+    'number_channels': 1000,
+    'Pout': 0.2E-3, #moles
+    'Vrest': -0.050,
+    'Vmax': -0.010,
+    'S': 1E-5, #s
+    'dt': 1E-9, #s
+    'diffusion_coefficient': 1E-8,
+    'aequorin_radius': 1E-8,
+    'M13_file': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'M13_Voltage_V3.xlsx'),
+    'cut_off': 5, #percentage of the brightest light samples averaged for the neuron
+    'chunk_size': 1000000,
+}
+
+
+#bubble_defaults updated with the given ones, unknown names raise a ValueError
+def getBubbleParameters(overrides=None):
+
+    parameters = dict(bubble_defaults)
+    for name, value in (overrides or {}).items():
+        if name not in parameters:
+            raise ValueError("unknown bubble parameter: " + str(name))
+        parameters[name] = value
+    return parameters
+
+
+#runs the bubble side into a trace store in directory, returns (M13 voltage in V, average light intensity)
+def runBubble(parameters, directory):
+
+    p = parameters
+    calcium_model = CalciumCluster(p['Vrest'], p['Vmax'], p['Pout'])
+    (init_ratio, init_Pin, init_Pout) = calcium_model.updateConcentrations(p['Vrest'])
+    photon_emiter = PhotonEmission(init_Pout, calcium_model.getPoutMax(), p['diffusion_coefficient'], p['aequorin_radius'], p['dt'])
+
+    bacteriophage = M13Phage(p['M13_file'])
+    bacteriophage.setUltrasound(p['soundwave_intensity'], p['number_channels'])
+    Vb = bacteriophage.getVoltage()
+
+    #streamed to disk, the full traces are never held in memory
+    n_steps = int(round(p['S']/p['dt']))
+    chunks = zapChunks(Vb, p['number_channels'], p['Vrest'], p['Vmax'], p['dt'], n_steps, calcium_model, photon_emiter, p['chunk_size'])
+    zapToStore(chunks, directory, p['dt'], p)
+
+    header, traces = openTraces(directory)
+    return (Vb, averageTopLight(traces['light'], p['cut_off']))
+
+
+#runs the neuron side with the given light intensity into a trace store in directory, returns the results
+#of headless.HeadlessSimulation.run
+def runNeuron(parameters, directory):
+
+    izhikevich, four_state_model, ChR2 = buildModels(parameters)
+    simulation = HeadlessSimulation(izhikevich, ChR2, getLightProtocol(parameters), parameters['dt'],
+                                    parameters['fast_forward_enabled'])
+    results = simulation.run(parameters['sim_time'])
+
+    with TraceStore(directory, parameters['dt'], 'ms', parameters) as store:
+        store.getWriter('v', 'mV').extend(results['v'])
+        store.getWriter('I', 'pA/pF').extend(results['I'])
+        store.getWriter('irradiance', 'mW/mm^2').extend(results['irradiance'])
+        store.getWriter('spike_times', 'ms').extend(results['spike_times'])
+
+    return results
+
+
+#runs one configuration and writes it to output/<name>, returns the summary
+def runConfig(config, output):
+
+    unknown = set(config) - {'name', 'bubble', 'neuron'}
+    if unknown:
+        raise ValueError("unknown configuration entries: " + ', '.join(sorted(unknown)))
+
+    name = str(config.get('name', 'run'))
+    directory = os.path.join(output, name)
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+
+    bubble_parameters = getBubbleParameters(config.get('bubble'))
+    Vb, light_intensity = runBubble(bubble_parameters, os.path.join(directory, 'bubble'))
+
+    neuron_parameters = getParameters(config.get('neuron'))
+    neuron_parameters['light_intensity'] = light_intensity
+    results = runNeuron(neuron_parameters, os.path.join(directory, 'neuron'))
+
+    spike_times = results['spike_times']
+    light_on = getLightProtocol(neuron_parameters).nextEdge(-np.inf)
+    summary = {'name': name,
+               'bubble': bubble_parameters,
+               'neuron': neuron_parameters,
+               'M13_voltage': Vb, #V
+               'light_intensity': light_intensity, #mW/mm^2
+               'spike_count': len(spike_times),
+               'first_spike_latency': float(spike_times[0] - light_on) if len(spike_times) else None, #ms after light onset
+               'peak_photocurrent': float(results['I'][np.argmax(np.abs(results['I']))]) if len(results['I']) else None, #pA/pF
+               'run_time': time.perf_counter() - start} #s
+
+    with open(os.path.join(directory, 'summary.json'), 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+
+    return summary
+
+
+#configurations in a config file, one object or a list of them; unnamed ones are named after the file
+def loadConfigs(path):
+
+    with open(path) as config_file:
+        configs = json.load(config_file)
+    if isinstance(configs, dict):
+        configs = [configs]
+
+    base = os.path.splitext(os.path.basename(path))[0]
+    for i, config in enumerate(configs):
+        if 'name' not in config:
+            config['name'] = base if len(configs) == 1 else '%s_%d' % (base, i)
+    return configs
+
+
+def runConfigs(configs, output, jobs=1):
+
+    names = [config['name'] for config in configs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError("duplicate configuration names: " + ', '.join(duplicates))
+
+    if jobs > 1:
+        from multiprocessing import Pool
+        with Pool(jobs) as pool:
+            return pool.starmap(runConfig, [(config, output) for config in configs])
+    return [runConfig(config, output) for config in configs]
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Runs the combined bubble -> neuron pipeline without graphics.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the configurations in one or more JSON files')
+    run_parser.add_argument('configs', nargs='+', help='JSON file with one configuration or a list of them')
+    run_parser.add_argument('-o', '--output', default='results', help='output directory (default: results)')
+    run_parser.add_argument('-j', '--jobs', type=int, default=1, help='configurations run in parallel (default: 1)')
+    args = parser.parse_args(argv)
+
+    configs = [config for path in args.configs for config in loadConfigs(path)]
+    for summary in runConfigs(configs, args.output, args.jobs):
+        print('%s: light %.4g mW/mm^2, %d spikes, %.1f s' % (summary['name'], summary['light_intensity'],
+                                                          summary['spike_count'], summary['run_time']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import json
+import pytest
+from pipeline import getBubbleParameters, loadConfigs, main, runConfigs
+from trace_store import openTraces
+
+CONFIG = {'name': 'short',
+          'bubble': {'S': 2E-6},
+          'neuron': {'sim_time': 200.0}}
+
+
+def test_cli_run_writes_traces_and_summary(tmp_path):
+
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps(CONFIG))
+    output = tmp_path / 'results'
+
+    assert main(['run', str(config_path), '-o', str(output)]) == 0
+
+    with open(str(output / 'short' / 'summary.json')) as summary_file:
+        summary = json.load(summary_file)
+    bubble_header, bubble = openTraces(str(output / 'short' / 'bubble'))
+    neuron_header, neuron = openTraces(str(output / 'short' / 'neuron'))
+
+    assert len(bubble['light']) == 2000
+    assert summary['light_intensity'] > 0
+    assert summary['neuron']['light_intensity'] == summary['light_intensity']
+    assert len(neuron['v']) == int(round(200.0/0.02))
+    assert summary['spike_count'] == len(neuron['spike_times'])
+
+
+def test_config_files(tmp_path):
+
+    path = tmp_path / 'sweep.json'
+    path.write_text(json.dumps([{'bubble': {'S': 1E-6}}, {'bubble': {'S': 2E-6}}]))
+    configs = loadConfigs(str(path))
+    assert [config['name'] for config in configs] == ['sweep_0', 'sweep_1']
+
+    with pytest.raises(ValueError):
+        runConfigs(configs + [dict(configs[0])], str(tmp_path))
+    with pytest.raises(ValueError):
+        getBubbleParameters({'soundwave': 2.0})
@@ -0,0 +1,148 @@
+"""
+On-disk trace store for long simulation runs
+
+Every trace (e.g. the SER voltage or the neuron membrane potential) is written
+straight to a raw binary file in the store directory instead of being kept in
+RAM. A small JSON header (header.json) records dt, units, the simulation
+parameters and the layout of every trace file.
+
+Reading back with openTraces() uses np.memmap, so a multi-GB trace is opened
+lazily, only the slices that are used get loaded, and several analysis
+processes can share the same file through the OS page cache.
+"""
+import json
+import os
+import numpy as np
+
+
+HEADER_FILE = 'header.json'
+
+
+class TraceWriter:
+
+    def __init__(self, path, dtype='<f8', buffer_size=65536):
+
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.file = open(path, 'wb')
+
+        #samples are collected in a small buffer and written in blocks
+        self.buffer = np.empty(buffer_size, dtype=self.dtype)
+        self.buffered = 0
+        self.length = 0
+
+    def append(self, value):
+        self.buffer[self.buffered] = value
+        self.buffered += 1
+        self.length += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        if self.buffered + len(values) <= len(self.buffer):
+            self.buffer[self.buffered:self.buffered + len(values)] = values
+            self.buffered += len(values)
+            if self.buffered == len(self.buffer):
+                self.flush()
+        else:
+            self.flush()
+            values.tofile(self.file)
+        self.length += len(values)
+
+    def flush(self):
+        self.buffer[:self.buffered].tofile(self.file)
+        self.buffered = 0
+        self.file.flush()
+
+    #drops everything written so far (same interface as the recorders in recorder.py)
+    def clear(self):
+        self.buffered = 0
+        self.length = 0
+        self.file.seek(0)
+        self.file.truncate()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __len__(self):
+        return self.length
+
+    #lazy read-only view of everything written so far
+    def view(self):
+        self.flush()
+        if self.length == 0:
+            return np.empty(0, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r', shape=(self.length,))
+
+
+class TraceStore:
+
+    def __init__(self, directory, dt, time_unit='s', parameters=None):
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.header = {'dt': dt,
+                       'time_unit': time_unit,
+                       'parameters': parameters or {},
+                       'traces': {}}
+        self.writers = {}
+        self.writeHeader()
+
+    #returns the writer of a trace, creating its file on first use
+    def getWriter(self, name, unit=''):
+
+        if name not in self.writers:
+            file_name = name + '.dat'
+            self.writers[name] = TraceWriter(os.path.join(self.directory, file_name))
+            self.header['traces'][name] = {'file': file_name,
+                                           'dtype': self.writers[name].dtype.str,
+                                           'unit': unit,
+                                           'length': 0}
+            self.writeHeader()
+
+        return self.writers[name]
+
+    def writeHeader(self):
+
+        for name, writer in self.writers.items():
+            self.header['traces'][name]['length'] = len(writer)
+
+        with open(os.path.join(self.directory, HEADER_FILE), 'w') as header_file:
+            json.dump(self.header, header_file, indent=2)
+
+    def close(self):
+
+        for writer in self.writers.values():
+            writer.close()
+        self.writeHeader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#opens a store written by TraceStore, returns (header, {name: np.memmap}).
+#The length comes from the file size, so runs that are still being written
+#can be read too (up to the last block flushed to disk)
+def openTraces(directory):
+
+    with open(os.path.join(directory, HEADER_FILE)) as header_file:
+        header = json.load(header_file)
+
+    traces = {}
+    for name, info in header['traces'].items():
+        path = os.path.join(directory, info['file'])
+        dtype = np.dtype(info['dtype'])
+        length = os.path.getsize(path)//dtype.itemsize
+        if length == 0:
+            traces[name] = np.empty(0, dtype=dtype)
+        else:
+            traces[name] = np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+
+    return (header, traces)
@@ -5,6 +5,8 @@ from calcium import CalciumCluster
 from M13_3D import M13Phage3D
 from vpython import scene, attach_light, vector, arrow, color, box, curve, text, sphere, button, slider, wtext, sqrt, graph, rate, gcurve
 from random import uniform
+from recorder import RingRecorder
+from downsample import makeRecorder
 
 
 ###############################################
@@ -30,6 +32,10 @@ dt = 1E-9 #ns
 #init voltage to the ser
 Vb = 0.04 #mV
 
+#recording policy of the graphs (see downsample.py): 'full' plots every time-step,
+#('decimate', k) every k-th one and ('envelope', k) the min/max of every k time-steps
+graph_recording = 'full'
+
 
 ###############################################
 ####              SET SCENE                ####
@@ -529,6 +535,16 @@ f13.plot([time, init_output_intensity/1000])
 
 time = time + time_step
 
+#samples of the loop reach the graphs through the recording policy, sample k is at (k+1)*time_step
+def graphRecorder(curve):
+    plot = lambda indices, values: curve.plot(list(zip(((indices+1)*time_step).tolist(), values.tolist())))
+    #the gcurves keep the points, the recorders only hold the last few
+    return makeRecorder(graph_recording, RingRecorder(1000), RingRecorder(1000, int), plot)
+
+voltage_recorder = graphRecorder(f12)
+concentration_recorder = graphRecorder(f1)
+light_recorder = graphRecorder(f13)
+
 #this loop will check every molecule inside the nano-bubble and update
 #their velocities according to certain conditions.
 while True:
@@ -654,8 +670,8 @@ while True:
           aequorin[1].color = vector(0,0,intens)
 
 
-      f12.plot([time, Vt*1000])
-      f1.plot([time, Pout_t*1E12])
-      f13.plot([time, output_intensity/1000])
+      voltage_recorder.append(Vt*1000)
+      concentration_recorder.append(Pout_t*1E12)
+      light_recorder.append(output_intensity/1000)
       time = time + time_step
       loop_num=loop_num+1
\ No newline at end of file
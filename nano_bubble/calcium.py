@@ -1,4 +1,5 @@
 from math import exp
+import numpy as np
 
 R = 8.314   #ideal gas constant
 T = 311.650 #average human brain temperature in Kelvin
@@ -33,6 +34,23 @@ class CalciumCluster:
         return (ratio, self.intra_conc, self.extra_conc)
 
 
+    #array version of updateConcentrations(), returns the extracellular
+    #concentration for every voltage in Vt (state is left at the last value)
+    def getExtraConcentrations(self, Vt, out=None):
+
+        extra_conc = np.divide(Vt, nernst_constant, out=out)
+        np.exp(extra_conc, out=extra_conc)
+        np.add(extra_conc, 1, out=extra_conc)
+        np.divide(self.total_conc, extra_conc, out=extra_conc)
+        np.subtract(self.total_conc, extra_conc, out=extra_conc)
+
+        if extra_conc.size > 0:
+            self.extra_conc = extra_conc.flat[-1]
+            self.intra_conc = self.total_conc - self.extra_conc
+
+        return extra_conc
+
+
     def getPoutMax(self):
         return self.Pout_max
 
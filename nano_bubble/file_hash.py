@@ -0,0 +1,14 @@
+"""
+Content hash of data files
+
+Used by M13.loadVoltageTable to revalidate the parsed voltage table sidecar and
+by zap_cache to invalidate cached zap() results when the voltage table changes.
+"""
+import hashlib
+
+
+#SHA-256 of a file's contents
+def fileHash(path):
+
+    with open(path, 'rb') as data_file:
+        return hashlib.sha256(data_file.read()).hexdigest()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Preallocated recorders for model traces (membrane potential, photocurrent, spike times)
+
+Every recorder has the same interface: append(value), extend(values), view(),
+clear() and len(). RingRecorder keeps only the last `capacity` samples, so an
+interactive session can run for hours with flat memory. ChunkedRecorder keeps
+everything in fixed-size NumPy chunks for full runs. trace_store.TraceWriter
+has the same interface and writes the samples to disk instead.
+
+Recorders are attached per variable, e.g. izhikevich.setRecorder('v', RingRecorder(30000)).
+
+"""
+import numpy as np
+
+class RingRecorder:
+    def __init__(self, capacity, dtype=float):
+        self.capacity = capacity
+        self.buffer = np.empty(capacity, dtype=dtype)
+        # index the next sample is written to
+        self.position = 0
+        # number of samples appended since the last clear
+        self.total = 0
+
+    def append(self, value):
+        self.buffer[self.position] = value
+        self.position += 1
+        if self.position == self.capacity:
+            self.position = 0
+        self.total += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.buffer.dtype)
+        count = len(values)
+        self.total += count
+        if count >= self.capacity:
+            self.buffer[:] = values[count - self.capacity:]
+            self.position = 0
+            return
+        first = min(count, self.capacity - self.position)
+        self.buffer[self.position:self.position + first] = values[:first]
+        self.buffer[:count - first] = values[first:]
+        self.position = (self.position + count) % self.capacity
+
+    # the samples held, oldest first
+    def view(self):
+        if self.total < self.capacity:
+            return self.buffer[:self.total].copy()
+        return np.concatenate((self.buffer[self.position:], self.buffer[:self.position]))
+
+    def clear(self):
+        self.position = 0
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+class ChunkedRecorder:
+    def __init__(self, chunk_size=65536, dtype=float):
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype)
+        self.clear()
+
+    def append(self, value):
+        if self.filled == self.chunk_size:
+            self.addChunk()
+        self.chunk[self.filled] = value
+        self.filled += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        start = 0
+        while start < len(values):
+            if self.filled == self.chunk_size:
+                self.addChunk()
+            count = min(len(values) - start, self.chunk_size - self.filled)
+            self.chunk[self.filled:self.filled + count] = values[start:start + count]
+            self.filled += count
+            start += count
+
+    def addChunk(self):
+        self.chunk = np.empty(self.chunk_size, dtype=self.dtype)
+        self.chunks.append(self.chunk)
+        self.filled = 0
+
+    # everything recorded so far as one array
+    def view(self):
+        return np.concatenate(self.chunks[:-1] + [self.chunk[:self.filled]])
+
+    def clear(self):
+        self.chunks = []
+        self.addChunk()
+
+    def __len__(self):
+        return (len(self.chunks) - 1)*self.chunk_size + self.filled
+
+    def __getitem__(self, index):
+        return self.view()[index]
@@ -1,4 +1,5 @@
-from math import exp
+from math import exp, log, ceil
+import numpy as np
 
 # {num_channels: (Rca [Ohms], tau [seconds])}
 channel_resistance_tau = {1: (5.28E14,0.237),   
@@ -9,6 +10,50 @@ channel_resistance_tau = {1: (5.28E14,0.237),
 
 
 
+#number of dt steps needed for the relaxation V0 -> steady_state_V to reach
+#Vmax (same closed form as SmoothEndoRet.relaxation). None if it never does.
+def stepsToThreshold(V0, steady_state_V, Vmax, dt, tau):
+
+    if V0 >= Vmax:
+        return 0
+    if steady_state_V <= Vmax:
+        return None
+
+    voltage = lambda j: steady_state_V + (V0 - steady_state_V)*exp(j*(-dt/tau))
+
+    #solve (V0 - Vss)*exp(-j*dt/tau) = Vmax - Vss for j, then fix any rounding
+    j = max(1, int(ceil(-(tau/dt)*log((Vmax - steady_state_V)/(V0 - steady_state_V)))))
+    while voltage(j) < Vmax:
+        j += 1
+    while j > 1 and voltage(j-1) >= Vmax:
+        j -= 1
+
+    return j
+
+
+#time for the relaxation V0 -> steady_state_V to reach Vmax without any dt
+#discretization (the exact crossing of the exponential). None if it never does.
+def timeToThreshold(V0, steady_state_V, Vmax, tau):
+
+    if V0 >= Vmax:
+        return 0.0
+    if steady_state_V <= Vmax:
+        return None
+
+    return tau*log((V0 - steady_state_V)/(Vmax - steady_state_V))
+
+
+#fills values[start+period:] by repeating values[start:start+period]
+#(copies the part already filled each time, so only a few copies are needed)
+def repeatCycle(values, start, period):
+
+    filled = period
+    while start + filled < len(values):
+        size = min(filled, len(values) - start - filled)
+        values[start+filled:start+filled+size] = values[start:start+size]
+        filled += size
+
+
 class SmoothEndoRet:
         
     def __init__(self, num_chan, Vrest, Vmax, dt):
@@ -32,3 +77,90 @@ class SmoothEndoRet:
             self.Vt = self.steady_state_V + (self.Vt - self.steady_state_V)*exp(-self.dt/self.tau)
             
         return self.Vt
+
+
+    #the next n values of nextTimeStep() are made of a head (relaxation from the
+    #current voltage up to the first crossing) followed by a cycle that repeats:
+    #reset to Vrest then relax until Vmax is reached again.
+    #Returns (head, period) in steps, period is None when there is no cycle
+    def getTraceLayout(self, n):
+
+        #state is already at/above threshold -> next step is the reset
+        #(if the SER never fires again the "cycle" simply runs past n)
+        if n > 0 and self.Vt >= self.Vmax:
+            return (0, min(self.getResetSteps() or n, n))
+
+        crossing = stepsToThreshold(self.Vt, self.steady_state_V, self.Vmax, self.dt, self.tau)
+        if crossing is None or crossing >= n:
+            return (n, None)
+
+        return (crossing, min(self.getResetSteps(), n - crossing))
+
+
+    #number of steps between two resets (None if the SER never fires)
+    def getResetSteps(self):
+
+        crossing = stepsToThreshold(self.Vrest, self.steady_state_V, self.Vmax, self.dt, self.tau)
+        if crossing is None:
+            return None
+
+        return crossing + 1
+
+
+    #event driven mode: the times (from now, in seconds) at which the SER resets
+    #to Vrest within horizon and the period between resets (inf if it stops firing).
+    #Nothing is stepped, so the cost is the same for any tau, Vb or horizon.
+    #By default resets land on the dt grid exactly like nextTimeStep() (the step
+    #after Vt >= Vmax), continuous=True gives the exact crossing times instead
+    def getResetTimes(self, horizon, continuous=False):
+
+        if continuous:
+            first = timeToThreshold(self.Vt, self.steady_state_V, self.Vmax, self.tau)
+            period = timeToThreshold(self.Vrest, self.steady_state_V, self.Vmax, self.tau)
+        else:
+            #count in whole steps so long sequences do not drift
+            first = stepsToThreshold(self.Vt, self.steady_state_V, self.Vmax, self.dt, self.tau)
+            first = None if first is None else first + 1
+            period = self.getResetSteps()
+
+        if first is None:
+            return (np.empty(0), float('inf'))
+
+        scale = 1.0 if continuous else self.dt
+        if period is None:
+            resets = np.array([first]) if first*scale <= horizon else np.empty(0)
+            return (resets*scale, float('inf'))
+
+        count = max(int((horizon/scale - first)//period) + 1, 0)
+        resets = first + np.arange(count)*period
+
+        return (resets*scale, period*scale)
+
+
+    #same as calling nextTimeStep() n times, but built with array operations
+    #(written into out when an array of length n is given)
+    def getVoltageTrace(self, n, out=None):
+
+        trace = np.empty(n) if out is None else out
+        head, period = self.getTraceLayout(n)
+
+        self.relaxation(trace[:head], self.Vt, 1)
+        if period is not None:
+            self.relaxation(trace[head:head+period], self.Vrest, 0)
+            trace[head] = self.Vrest
+            repeatCycle(trace, head, period)
+
+        if n > 0:
+            self.Vt = trace[-1]
+
+        return trace
+
+
+    #writes Vss + (V0 - Vss)*exp(-j*dt/tau) for j = first, first+1, ... into out
+    def relaxation(self, out, V0, first):
+
+        out[:] = np.arange(first, first + len(out))
+        np.multiply(out, -self.dt/self.tau, out=out)
+        np.exp(out, out=out)
+        np.multiply(out, V0 - self.steady_state_V, out=out)
+        np.add(out, self.steady_state_V, out=out)
@@ -0,0 +1,5 @@
+#the modules of this folder import each other by name, as when run from nano_bubble/
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
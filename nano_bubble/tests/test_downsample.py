@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from downsample import downsample, envelopeForPixels, lttb, lttbForPixels, makeRecorder
+
+
+def test_envelope_streamed_in_chunks_matches_whole_trace():
+
+    values = np.random.default_rng(0).normal(size=1003)
+    recorder = makeRecorder(('envelope', 10))
+    for start in range(0, len(values), 37):
+        recorder.extend(values[start:start + 37])
+    recorder.append(5.0)
+    recorder.flush()
+
+    indices, kept = downsample(np.append(values, 5.0), ('envelope', 10))
+    assert np.array_equal(recorder.getIndices(), indices)
+    assert np.array_equal(recorder.view(), kept)
+    assert np.array_equal(kept, np.append(values, 5.0)[indices])
+
+
+def test_envelope_keeps_the_extremes():
+
+    values = np.sin(np.arange(10000)/40.0)
+    values[4321] = 7.0
+    values[8765] = -7.0
+    indices, kept = downsample(values, envelopeForPixels(len(values), 100))
+    assert kept.max() == 7.0 and kept.min() == -7.0
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_decimate():
+
+    indices, kept = downsample(np.arange(10.0), ('decimate', 3))
+    assert indices.tolist() == [0, 3, 6, 9]
+    assert kept.tolist() == [0.0, 3.0, 6.0, 9.0]
+
+
+def test_lttb():
+
+    values = np.random.default_rng(1).normal(size=10001)
+    indices, kept = downsample(values, lttbForPixels(len(values), 500))
+    assert indices[0] == 0 and indices[-1] == len(values) - 1
+    assert len(indices) == 502
+    assert np.all(np.diff(indices) > 0)
+    assert np.array_equal(kept, values[indices])
+
+    #a spike far above the rest is always picked
+    values[5000] = 100.0
+    assert 5000 in lttb(values, 20)[0]
+
+
+def test_lttb_is_not_a_recording_policy():
+
+    with pytest.raises(ValueError):
+        makeRecorder(('lttb', 10))
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from calcium import CalciumCluster
+from light_transfer import LightTransferTable
+from photon_emission import PhotonEmission
+
+Pout = 0.2E-3
+Vrest = -0.050
+Vmax = -0.010
+dt = 1E-9
+
+
+@pytest.fixture
+def table():
+
+    calcium_model = CalciumCluster(Vrest, Vmax, Pout)
+    init_Pout = calcium_model.updateConcentrations(Vrest)[2]
+    photon_emiter = PhotonEmission(init_Pout, calcium_model.getPoutMax(), 1E-8, 1E-8, dt)
+    return LightTransferTable(calcium_model, photon_emiter, Vrest, Vmax, dt)
+
+
+def test_lookup_matches_the_exact_chain(table):
+
+    Vt = np.linspace(Vrest - 0.005, Vmax + 0.005, 1001)
+    Pout_t, light = table.lookup(Vt)
+    Pout_exact, light_exact = table.evaluate(Vt)
+
+    #the tolerance is relative to the largest value in the table
+    assert np.max(np.abs(Pout_t - Pout_exact)) <= 2*table.tolerance*np.max(np.abs(table.Pout_table))
+    assert np.max(np.abs(light - light_exact)) <= 2*table.tolerance*np.max(np.abs(table.light_table))
+
+    #outside [Vrest, Vmax] the exact chain is used
+    outside = (Vt < Vrest) | (Vt > Vmax)
+    assert np.array_equal(light[outside], light_exact[outside])
+
+
+def test_lookup_shapes(table):
+
+    Vt = np.linspace(Vrest, Vmax + 0.001, 12)
+    Pout_t, light = table.lookup(Vt)
+    Pout_grid, light_grid = table.lookup(Vt.reshape(3, 4))
+    assert light_grid.shape == (3, 4)
+    assert np.array_equal(light_grid.ravel(), light)
+
+    for V, expected in zip(Vt, light):
+        assert table.lookup(V)[1] == expected
+        assert table.lookupVoltage(V)[1] == pytest.approx(expected, rel=1E-12)
+    assert isinstance(table.lookup(-0.03)[0], float)
+
+
+def test_rebuilds_after_a_parameter_change(table):
+
+    before = table.lookup(-0.03)[1]
+    table.calcium_model.total_conc *= 2
+    after = table.lookup(-0.03)[1]
+    assert after != before
+    assert after == pytest.approx(float(table.evaluate(np.array([-0.03]))[1][0]), rel=1E-5)
@@ -0,0 +1,117 @@
+import os
+import numpy as np
+import pytest
+import M13
+from file_hash import fileHash
+from M13 import M13Phage, index, loadVoltageTable
+
+M13_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'M13_Voltage_V3.xlsx')
+
+
+@pytest.fixture(scope='module')
+def phage():
+    return M13Phage(M13_FILE)
+
+
+def setUltrasound(phage, intensity, channels):
+    phage.setUltrasound(intensity, channels)
+    return phage.getVoltage()
+
+
+def test_scalar_input_gives_scalar(phage):
+
+    voltage = phage.getVoltages(2.0, 1000)
+    assert isinstance(voltage, float)
+    assert voltage == phage.getVoltages([2.0], [1000])[0]
+
+
+def test_table_rows_match_setUltrasound(phage):
+
+    for intensity in phage.intensity_array[1::7].tolist():
+        for channels in index:
+            assert phage.getVoltages(intensity, channels) == pytest.approx(setUltrasound(phage, intensity, channels))
+
+
+def test_out_of_range_is_zero_like_setUltrasound(phage):
+
+    x = phage.intensity_array
+    for intensity in (x[0] - 0.01, x[0], x[-1] + 1.0):
+        assert setUltrasound(phage, intensity, 1000) == 0
+        assert phage.getVoltages(intensity, 1000) == 0.0
+
+
+def test_broadcasting(phage):
+
+    intensities = np.array([0.5, 1.0, 2.0])
+    voltages = phage.getVoltages(intensities[:, None], np.array([1, 50, 1000]))
+    assert voltages.shape == (3, 3)
+    assert voltages[1, 2] == phage.getVoltages(1.0, 1000)
+
+
+def test_channels_outside_table(phage):
+
+    with pytest.raises(ValueError):
+        phage.getVoltages(1.0, 2000)
+
+
+def test_setUltrasound_interpolation(phage):
+
+    x = phage.intensity_array
+    intensities = np.concatenate([x[:5], (x[:-1] + x[1:])/2, [x[-1], x[-1] + 1.0, 0.01, 2.0, 7.3]])
+    for channels in index:
+        voltages = phage.getVoltages(intensities, channels, interpolation="setUltrasound")
+        expected = [setUltrasound(phage, intensity, channels) for intensity in intensities.tolist()]
+        assert np.array_equal(voltages, expected)
+
+
+def test_setUltrasound_interpolation_needs_table_channels(phage):
+
+    with pytest.raises(ValueError):
+        phage.getVoltages(1.0, 200, interpolation="setUltrasound")
+    with pytest.raises(ValueError):
+        phage.getVoltages(1.0, 1000, interpolation="cubic")
+
+
+
+#small voltage table in the layout of M13_Voltage_V3.xlsx: intensities in column C and
+#the voltages for 1000, 500, 100, 50 and 1 channels from column D, starting at row 5
+def writeWorkbook(path, offset=0.0):
+
+    from openpyxl import Workbook
+    workbook = Workbook()
+    for row, intensity in enumerate([0.5, 1.0, 2.0], start=5):
+        workbook.active.cell(row=row, column=3, value=intensity)
+        for column in range(5):
+            workbook.active.cell(row=row, column=4 + column, value=intensity*(column + 1)/100 + offset)
+    workbook.save(path)
+
+
+def test_sidecar_is_revalidated(tmp_path, monkeypatch):
+
+    path = str(tmp_path / 'table.xlsx')
+    writeWorkbook(path)
+    intensities, voltages = loadVoltageTable(path)
+    assert intensities.tolist() == [0.5, 1.0, 2.0] and voltages.shape == (3, 5)
+    with np.load(path + '.npz') as data:
+        assert str(data['sha256']) == fileHash(path)
+        assert np.array_equal(data['voltages'], voltages)
+
+    #same content with a new mtime: the sidecar matches by hash, the workbook is not parsed
+    #again and the sidecar gets the new stamp
+    def fail(fileName):
+        raise AssertionError('the workbook should not be parsed')
+    monkeypatch.setattr(M13, 'readWorkbook', fail)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert np.array_equal(loadVoltageTable(path)[1], voltages)
+    with np.load(path + '.npz') as data:
+        assert tuple(data['stamp'].tolist()) == (stat.st_mtime_ns + 10**9, stat.st_size)
+    monkeypatch.undo()
+
+    #new content: the sidecar is stale and rewritten from the workbook
+    writeWorkbook(path, offset=1.0)
+    changed = loadVoltageTable(path)[1]
+    assert np.allclose(changed, voltages + 1.0)
+    with np.load(path + '.npz') as data:
+        assert str(data['sha256']) == fileHash(path)
+        assert np.array_equal(data['voltages'], changed)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from ser import SmoothEndoRet
+
+Vrest = -0.050
+Vmax = -0.010
+dt = 1E-9
+
+
+#the steps (1 = the next call) at which nextTimeStep() resets to Vrest
+def steppedResets(ser, n):
+
+    resets = []
+    for step in range(1, n + 1):
+        previous = ser.Vt
+        ser.nextTimeStep()
+        if previous >= ser.Vmax:
+            resets.append(step)
+    return np.array(resets)
+
+
+@pytest.mark.parametrize('Vb, channels, warmup', [(0.06, 1000, 0), (0.045, 500, 0), (0.1, 100, 37), (0.06, 1000, 262)])
+def test_reset_times_match_stepping(Vb, channels, warmup):
+
+    ser = SmoothEndoRet(channels, Vrest, Vmax, dt)
+    ser.updateVoltage(Vb)
+    for _ in range(warmup):
+        ser.nextTimeStep()
+
+    n = 40000
+    resets, period = ser.getResetTimes(n*dt)
+    expected = steppedResets(ser, n)
+
+    assert len(expected) > 1
+    assert np.allclose(resets, expected*dt, rtol=0, atol=1E-3*dt)
+    assert period == pytest.approx(np.diff(expected)[0]*dt)
+
+
+def test_continuous_resets_lie_within_a_step():
+
+    ser = SmoothEndoRet(1000, Vrest, Vmax, dt)
+    ser.updateVoltage(0.06)
+    stepped, stepped_period = ser.getResetTimes(1E-6)
+    continuous, period = ser.getResetTimes(1E-6, continuous=True)
+
+    #the stepped SER crosses Vmax at most one step after the exponential does,
+    #and resets on the step after that
+    assert stepped_period - 2*dt < period <= stepped_period
+    assert np.all(continuous[:3] < stepped[:3])
+    assert np.all(stepped[:3] - continuous[:3] < 2*(np.arange(3) + 1)*dt)
+
+
+def test_no_resets_below_threshold():
+
+    ser = SmoothEndoRet(1000, Vrest, Vmax, dt)
+    ser.updateVoltage(0.02)
+    #the SER starts at 0 V, above threshold, so it resets once and then never again
+    resets, period = ser.getResetTimes(1E-3)
+    assert resets == pytest.approx([dt]) and period == float('inf')
+    assert steppedResets(ser, 3000).tolist() == [1]
+    assert len(ser.getResetTimes(1E-3)[0]) == 0
@@ -0,0 +1,37 @@
+import numpy as np
+from trace_store import TraceStore, TraceWriter, openTraces
+
+
+def test_extend_filling_the_buffer_then_append(tmp_path):
+
+    writer = TraceWriter(str(tmp_path / 'trace.f8'), buffer_size=4)
+    writer.extend(np.zeros(4))
+    writer.append(1.0)
+    writer.close()
+
+    assert np.fromfile(str(tmp_path / 'trace.f8')).tolist() == [0.0, 0.0, 0.0, 0.0, 1.0]
+
+
+def test_mixed_writes_round_trip(tmp_path):
+
+    values = np.arange(23, dtype=float)
+    writer = TraceWriter(str(tmp_path / 'trace.f8'), buffer_size=4)
+    writer.append(values[0])
+    writer.extend(values[1:4])
+    writer.extend(values[4:15])
+    for value in values[15:]:
+        writer.append(value)
+    assert len(writer) == len(values)
+    writer.close()
+
+    assert np.array_equal(np.fromfile(str(tmp_path / 'trace.f8')), values)
+
+
+def test_store_round_trip(tmp_path):
+
+    with TraceStore(str(tmp_path), 1e-9, 's', {'S': 1e-5}) as store:
+        store.getWriter('Vt', 'mV').extend(np.linspace(-50, -10, 100))
+    header, traces = openTraces(str(tmp_path))
+
+    assert header['parameters'] == {'S': 1e-5}
+    assert np.allclose(traces['Vt'], np.linspace(-50, -10, 100))
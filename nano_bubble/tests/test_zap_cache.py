@@ -0,0 +1,68 @@
+import os
+import shutil
+import numpy as np
+from zap_cache import ZapCache, getZapParameters
+
+M13_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'M13_Voltage_V3.xlsx')
+CONSTANTS = {'Pout': 0.2E-3, 'Vrest': -0.050, 'Vmax': -0.010, 'dt': 1E-9, 'S': 1E-6, 'n_steps': 1000,
+             'diffusion_coefficient': 1E-8, 'aequorin_radius': 1E-8}
+
+
+class Table:
+    tolerance = 1E-6
+    max_points = 2**20
+
+
+def getKey(engine='vectorized', intensity=2.0, channels=1000, constants=CONSTANTS, M13_file=M13_FILE, light_table=Table()):
+    return ZapCache('unused').getKey(getZapParameters(intensity, channels, engine, constants, M13_file, light_table))
+
+
+def test_key_depends_on_engine():
+
+    keys = {getKey(engine) for engine in ('loop', 'table', 'vectorized')}
+    assert len(keys) == 3
+    assert getKey('loop') == getKey('loop')
+
+
+def test_key_depends_on_inputs_and_constants():
+
+    assert getKey(intensity=2.0) != getKey(intensity=2.5)
+    assert getKey(channels=1000) != getKey(channels=500)
+    assert getKey(constants=dict(CONSTANTS, dt=2E-9)) != getKey()
+
+
+def test_key_depends_on_light_table_only_for_table_engine():
+
+    coarse = Table()
+    coarse.tolerance = 1E-3
+    assert getKey('table', light_table=coarse) != getKey('table')
+    assert getKey('loop', light_table=coarse) == getKey('loop')
+
+
+def test_key_depends_on_M13_file_content(tmp_path):
+
+    copy = str(tmp_path / 'M13.xlsx')
+    shutil.copy(M13_FILE, copy)
+    assert getKey(M13_file=copy) == getKey()
+    with open(copy, 'ab') as data_file:
+        data_file.write(b'\0')
+    assert getKey(M13_file=copy) != getKey()
+
+
+def test_directory_created_on_first_store(tmp_path):
+
+    directory = str(tmp_path / 'cache')
+    cache = ZapCache(directory)
+    assert not os.path.exists(directory)
+    assert cache.get({'a': 1}) is None
+    assert not os.path.exists(directory)
+
+    calls = []
+    compute = lambda: calls.append(1) or (np.arange(3.0), np.ones(2))
+    first = cache.getOrCompute({'a': 1}, compute)
+    second = cache.getOrCompute({'a': 1}, compute)
+
+    assert os.path.isdir(directory)
+    assert len(calls) == 1
+    assert all(np.array_equal(x, y) for x, y in zip(first, second))
+    assert cache.getStats() == {'hits': 1, 'misses': 2}
@@ -0,0 +1,146 @@
+from itertools import islice
+import numpy as np
+import pytest
+from calcium import CalciumCluster
+from photon_emission import PhotonEmission
+from ser import SmoothEndoRet
+from zap_engine import averageTopLight, chooseTimeStep, zapAutoDt, zapChunks, zapVectorized, zapVectorizedBatch
+
+Pout = 0.2E-3
+Vrest = -0.050
+Vmax = -0.010
+dt = 1E-9
+n_steps = 3000
+
+
+@pytest.fixture
+def models():
+
+    calcium_model = CalciumCluster(Vrest, Vmax, Pout)
+    init_Pout = calcium_model.updateConcentrations(Vrest)[2]
+    photon_emiter = PhotonEmission(init_Pout, calcium_model.getPoutMax(), 1E-8, 1E-8, dt)
+    return (calcium_model, photon_emiter)
+
+
+#the stepping loop of bubble_analysis.zap(engine="loop")
+def zapLoop(Vb, channels, calcium_model, photon_emiter):
+
+    init_Pout = calcium_model.updateConcentrations(Vrest)[2]
+    ser = SmoothEndoRet(channels, Vrest, Vmax, dt)
+    ser.updateVoltage(Vb)
+
+    Vt_array = np.zeros(n_steps)
+    Pt_out_array = np.zeros(n_steps)
+    light_array = np.zeros(n_steps)
+    Vt_array[0] = Vrest*1000
+    Pt_out_array[0] = init_Pout*1000
+    light_array[0] = photon_emiter.getLightIntensity(init_Pout, dt)/1000
+
+    for t in range(1, n_steps):
+        Vt = ser.nextTimeStep()
+        Vt_array[t] = Vt*1000
+        Pout_t = calcium_model.updateConcentrations(Vt)[2]
+        Pt_out_array[t] = Pout_t*1000
+        light_array[t] = photon_emiter.getLightIntensity(Pout_t, dt)/1000
+
+    return (Vt_array, Pt_out_array, light_array)
+
+
+@pytest.mark.parametrize('Vb, channels', [(0.06, 1000), (0.045, 500), (0.1, 100), (0.02, 1000), (0.06, 1)])
+def test_vectorized_matches_loop(models, Vb, channels):
+
+    expected = zapLoop(Vb, channels, *models)
+    result = zapVectorized(Vb, channels, Vrest, Vmax, dt, n_steps, *models)
+
+    #the light is 1 - P(no emission) for a small flux, its rounding differs between
+    #the scalar and the array formula by ~1E-8 relative
+    for values, reference in zip(result, expected):
+        assert np.allclose(values, reference, rtol=1E-7, atol=0)
+
+
+def test_batch_matches_single_runs(models):
+
+    Vbs = np.array([0.06, 0.045, 0.1, 0.02, 0.06])
+    channels = np.array([1000, 500, 100, 1000, 1])
+    batch = zapVectorizedBatch(Vbs, channels, Vrest, Vmax, dt, n_steps, *models)
+
+    for i, (Vb, chan) in enumerate(zip(Vbs, channels)):
+        single = zapVectorized(Vb, int(chan), Vrest, Vmax, dt, n_steps, *models)
+        for rows, values in zip(batch, single):
+            assert np.allclose(rows[i], values, rtol=1E-12, atol=0)
+
+
+def test_batch_broadcasts(models):
+
+    Vt_array, Pt_out_array, light_array = zapVectorizedBatch([0.06, 0.1], 1000, Vrest, Vmax, dt, 10, *models)
+    assert Vt_array.shape == Pt_out_array.shape == light_array.shape == (2, 10)
+    assert zapVectorizedBatch([0.06], [1000], Vrest, Vmax, dt, 0, *models)[0].shape == (1, 0)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 262, 1000, 5000])
+def test_chunks_match_one_run(models, chunk_size):
+
+    expected = zapVectorized(0.06, 1000, Vrest, Vmax, dt, n_steps, *models)
+    chunks = list(zapChunks(0.06, 1000, Vrest, Vmax, dt, n_steps, *models, chunk_size=chunk_size))
+
+    assert all(len(chunk[0]) == chunk_size for chunk in chunks[:-1])
+    time_array = np.concatenate([chunk[0] for chunk in chunks])
+    assert np.allclose(time_array, np.arange(n_steps)*dt, rtol=1E-12, atol=0)
+    #the light of a sample computed in another chunk rounds differently (see above)
+    for k, (reference, rtol) in enumerate(zip(expected, [1E-12, 1E-12, 1E-7])):
+        values = np.concatenate([chunk[k + 1] for chunk in chunks])
+        assert np.allclose(values, reference, rtol=rtol, atol=0)
+
+
+def test_chunks_stream_forever(models):
+
+    chunks = list(islice(zapChunks(0.06, 1000, Vrest, Vmax, dt, None, *models, chunk_size=500), 6))
+    expected = zapVectorized(0.06, 1000, Vrest, Vmax, dt, n_steps, *models)
+    assert np.allclose(np.concatenate([chunk[3] for chunk in chunks]), expected[2], rtol=1E-7, atol=0)
+
+
+def test_average_top_light():
+
+    light = np.random.default_rng(0).random(1000)
+    assert averageTopLight(light, 5) == pytest.approx(np.sort(light)[-50:].mean())
+    assert averageTopLight([3.0, 1.0, 2.0], 5) == 3.0
+
+
+@pytest.mark.parametrize('Vb, channels', [(0.06, 1000), (0.1, 100), (0.035, 500)])
+def test_auto_dt_matches_stepping_at_the_chosen_dt(models, Vb, channels):
+
+    step = chooseTimeStep(Vb, channels, Vrest, Vmax)
+    n = int(round(2E-6/step))
+    Vt_array, Pt_out_array, light_array, used = zapAutoDt(Vb, channels, Vrest, Vmax, np.arange(n)*step, step, *models)
+    expected = zapVectorized(Vb, channels, Vrest, Vmax, step, n + 1, *models)
+
+    assert used == step
+    #zap() holds Vrest for one more sample, it resets from 0V on its first step. At
+    #sub-ns steps the light formula loses digits (1 - P(no emission) for a tiny
+    #flux), so the light only agrees to ~1E-8 of its largest value
+    for values, reference, tolerance in zip((Vt_array, Pt_out_array, light_array), expected, [1E-12, 1E-12, 1E-7]):
+        assert np.allclose(values, reference[1:], rtol=0, atol=tolerance*np.max(np.abs(reference)))
+
+
+def test_auto_dt_reset_period(models):
+
+    step = chooseTimeStep(0.06, 1000, Vrest, Vmax)
+    ser = SmoothEndoRet(1000, Vrest, Vmax, step)
+    ser.updateVoltage(0.06)
+    exact = ser.getResetTimes(1E-6, continuous=True)[1]
+    assert abs(ser.getResetTimes(1E-6)[1] - exact) <= 1E-3*exact
+
+    #the 1 ns grid is two steps off, enough to drift out of phase within a few resets
+    ser = SmoothEndoRet(1000, Vrest, Vmax, dt)
+    ser.updateVoltage(0.06)
+    assert ser.getResetTimes(1E-6)[1] == pytest.approx(262*dt)
+    assert exact == pytest.approx(260.37E-9, rel=1E-4)
+
+
+def test_auto_dt_matches_any_dt_without_firing(models):
+
+    expected = zapVectorized(0.02, 1000, Vrest, Vmax, dt, n_steps + 1, *models)
+    result = zapAutoDt(0.02, 1000, Vrest, Vmax, np.arange(n_steps)*dt, dt, *models)
+    assert result[3] > dt
+    for values, reference in zip(result[:3], expected):
+        assert np.allclose(values, reference[1:], rtol=1E-12, atol=0)
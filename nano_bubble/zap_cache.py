@@ -0,0 +1,113 @@
+"""
+Persistent, content-addressed cache for zap() results
+
+Every result is stored as an .npz file whose name is the SHA-256 of the
+simulation parameters (plus MODEL_VERSION, so changing the models invalidates
+old entries). Files are touched on every hit and the least recently used ones
+are evicted once the cache grows past max_bytes. The directory is only
+created when the first result is stored.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from file_hash import fileHash
+
+
+#bump whenever a change in ser/calcium/photon_emission/M13 changes zap() outputs
+MODEL_VERSION = 1
+
+
+#cache parameters of a zap() run: the physical constants (a dict), the input, the engine (the
+#engines differ by their interpolation error), the light table settings for engine="table"
+#and the content of the M13 voltage table file
+def getZapParameters(input_soundwave, channels, engine, constants, M13_file, light_table=None):
+
+    parameters = dict(constants)
+    parameters.update({'input_soundwave': float(input_soundwave), 'channels': int(channels),
+                       'engine': str(engine), 'M13_table': fileHash(M13_file)})
+    if engine == "table":
+        parameters['table_tolerance'] = light_table.tolerance
+        parameters['table_max_points'] = light_table.max_points
+    return parameters
+
+
+class ZapCache:
+
+    def __init__(self, directory, max_bytes=2*1024**3):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+    #hash of every parameter that changes the outputs (values must be JSON serializable)
+    def getKey(self, parameters):
+
+        text = json.dumps({'model_version': MODEL_VERSION, 'parameters': parameters}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def getPath(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    #returns the cached arrays for these parameters, or None
+    def get(self, parameters):
+
+        path = self.getPath(self.getKey(parameters))
+        try:
+            with np.load(path) as data:
+                arrays = tuple(data['arr_%d' % i] for i in range(len(data.files)))
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        #mark as recently used for the LRU eviction
+        os.utime(path)
+        self.hits += 1
+        return arrays
+
+    def put(self, parameters, arrays):
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.getPath(self.getKey(parameters))
+
+        #write to a temporary file first so other processes never see half a result
+        temp_path = path + '.%d.tmp' % os.getpid()
+        with open(temp_path, 'wb') as cache_file:
+            np.savez(cache_file, *arrays)
+        os.replace(temp_path, path)
+
+        self.evict()
+
+    #returns the cached result or runs compute() and stores what it returns
+    def getOrCompute(self, parameters, compute):
+
+        arrays = self.get(parameters)
+        if arrays is None:
+            arrays = tuple(compute())
+            self.put(parameters, arrays)
+
+        return arrays
+
+    #deletes the least recently used entries until the cache fits in max_bytes
+    def evict(self):
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def getStats(self):
+        return {'hits': self.hits, 'misses': self.misses}
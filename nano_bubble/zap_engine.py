@@ -0,0 +1,237 @@
+"""
+Array based engines for zap() (M13 -> SER -> calcium -> photon emission)
+
+The SER relaxation between resets is a closed form exponential and the
+calcium/photon outputs are pure functions of the SER voltage, so a whole
+simulation can be built with NumPy operations instead of stepping every dt.
+"""
+import numpy as np
+from ser import SmoothEndoRet, channel_resistance_tau, repeatCycle, timeToThreshold
+from trace_store import TraceStore
+from downsample import makeRecorder
+
+
+# =============================================================================
+#  zapVectorized() returns the same three arrays as the stepping zap() loop:
+#  membrane voltage (mV), extracellular concentration (mM) and light (mW/mm^2)
+# =============================================================================
+def zapVectorized(Vb, channels, Vrest, Vmax, dt, n_steps, calcium_model, photon_emiter, out=None):
+
+    #instantiate SER class and apply the source voltage
+    ser = SmoothEndoRet(channels, Vrest, Vmax, dt)
+    ser.updateVoltage(Vb)
+
+    #output arrays (or the rows of a batch, see zapVectorizedBatch)
+    if out is None:
+        out = (np.empty(n_steps), np.empty(n_steps), np.empty(n_steps))
+
+    #first sample is the resting state, the rest comes from the SER trace
+    return simulateChunk(ser, calcium_model, photon_emiter, dt, out, True)
+
+
+#fills out = (Vt, Pout, light) with the next len(Vt) samples of the SER (plus the
+#resting sample zap() starts with when rest_sample is True) and the matching
+#calcium/light values, in mV, mM and mW/mm^2. The SER keeps its state, so
+#consecutive calls continue the same simulation
+def simulateChunk(ser, calcium_model, photon_emiter, dt, out, rest_sample):
+
+    (Vt_array, Pt_out_array, light_array) = out
+    n_steps = len(Vt_array)
+    first = 1 if (rest_sample and n_steps > 0) else 0
+
+    head, period = ser.getTraceLayout(n_steps - first)
+    Vt_array[:first] = ser.Vrest
+    ser.getVoltageTrace(n_steps - first, out=Vt_array[first:])
+
+    #calcium and light only depend on Vt, so once the SER settles into its
+    #reset cycle they are computed for one period and repeated
+    end = n_steps if period is None else first + head + period
+    calcium_model.getExtraConcentrations(Vt_array[:end], out=Pt_out_array[:end])
+    photon_emiter.getLightIntensities(Pt_out_array[:end], dt, out=light_array[:end])
+
+    #convert to mV, mM and mW/mm^2 (in place, these arrays can be large)
+    np.multiply(Vt_array, 1000, out=Vt_array)
+    np.multiply(Pt_out_array[:end], 1000, out=Pt_out_array[:end])
+    np.divide(light_array[:end], 1000, out=light_array[:end])
+
+    if period is not None:
+        repeatCycle(Pt_out_array, first + head, period)
+        repeatCycle(light_array, first + head, period)
+
+    return (Vt_array,
+            Pt_out_array,
+            light_array)
+
+
+# =============================================================================
+#  zapChunks() is the streaming version of zapVectorized() for long runs. It
+#  yields (time, Vt, Pout, light) chunks of chunk_size samples and carries the
+#  SER state across chunks, so memory stays constant whatever n_steps is
+#  (n_steps=None streams forever)
+# =============================================================================
+def zapChunks(Vb, channels, Vrest, Vmax, dt, n_steps, calcium_model, photon_emiter, chunk_size=1000000):
+
+    ser = SmoothEndoRet(channels, Vrest, Vmax, dt)
+    ser.updateVoltage(Vb)
+
+    start = 0
+    while n_steps is None or start < n_steps:
+
+        n = chunk_size if n_steps is None else min(chunk_size, n_steps - start)
+        time_array = (start + np.arange(n))*dt
+        out = (np.empty(n), np.empty(n), np.empty(n))
+
+        (Vt_array, Pt_out_array, light_array) = simulateChunk(ser, calcium_model, photon_emiter, dt, out, start == 0)
+        yield (time_array, Vt_array, Pt_out_array, light_array)
+
+        start += n
+
+
+# =============================================================================
+#  zapAutoDt() picks the SER time step from its time constant instead of using
+#  the same dt for every number of channels (1 channel has tau = 0.237 s, so a
+#  1 ns step oversamples it by ~6 orders of magnitude). The step is the largest
+#  one that keeps the reset times within reset_tolerance of the reset period
+#  and resolves tau with at least steps_per_tau steps. The SER resets on that
+#  step grid (event driven, see SmoothEndoRet.getResetTimes) and the outputs are
+#  evaluated at the caller's time_grid from the time since the last reset.
+#  light_dt is the photon counting interval (the dt the light intensity was
+#  calibrated for in zap()), it does not change with the chosen step.
+#  Returns (Vt, Pout, light, dt) with dt the step that was used
+#
+#  The result is the SER stepped at the chosen dt, not at the caller's dt. On
+#  the grid k*dt of the chosen dt, sample k equals sample k+1 of zapVectorized()
+#  run at that dt (zap() spends its first step resetting from 0V). A run at a
+#  coarser dt has a different reset period (262 ns at 1 ns steps against the
+#  exact 260.37 ns for 1000 channels and Vb = 0.06 V), so a firing SER drifts
+#  out of phase with it after a few resets. Only configurations that never fire
+#  match zapVectorized() (shifted by one sample) at any dt
+# =============================================================================
+def chooseTimeStep(Vb, channels, Vrest, Vmax, reset_tolerance=1E-3, steps_per_tau=20):
+
+    tau = channel_resistance_tau[channels][1]
+    dt = tau/steps_per_tau
+
+    #on a step grid each reset period is at most two steps longer than the exact one
+    #(the crossing lands on the next step and the reset takes one more)
+    period = timeToThreshold(Vrest, Vrest + Vb, Vmax, tau)
+    if period is not None:
+        dt = min(dt, reset_tolerance*period/2)
+
+    return dt
+
+
+def zapAutoDt(Vb, channels, Vrest, Vmax, time_grid, light_dt, calcium_model, photon_emiter,
+              reset_tolerance=1E-3, steps_per_tau=20):
+
+    dt = chooseTimeStep(Vb, channels, Vrest, Vmax, reset_tolerance, steps_per_tau)
+    time_grid = np.asarray(time_grid, dtype=float)
+
+    ser = SmoothEndoRet(channels, Vrest, Vmax, dt)
+    ser.updateVoltage(Vb)
+
+    #start relaxing from Vrest at t = 0 (zap() resets its initial 0V state on the first step)
+    ser.Vt = Vrest
+    horizon = time_grid[-1] if len(time_grid) > 0 else 0.0
+    reset_times, period = ser.getResetTimes(horizon)
+
+    #relaxation from Vrest since the last reset (or since t = 0)
+    starts = np.concatenate(([0.0], reset_times))
+    since_reset = time_grid - starts[np.maximum(np.searchsorted(starts, time_grid, side='right') - 1, 0)]
+    Vt_array = ser.steady_state_V + (Vrest - ser.steady_state_V)*np.exp(-since_reset/ser.tau)
+
+    Pt_out_array = calcium_model.getExtraConcentrations(Vt_array)
+    light_array = photon_emiter.getLightIntensities(Pt_out_array, light_dt)
+
+    return (Vt_array * 1000,
+            Pt_out_array * 1000,
+            light_array / 1000,
+            dt)
+
+
+# =============================================================================
+#  zapToStore() writes the chunks of zapChunks() straight to a TraceStore
+#  directory (Vt in mV, Pout in mM, light in mW/mm^2, read back lazily with
+#  trace_store.openTraces) and returns the store header
+# =============================================================================
+def zapToStore(chunks, directory, dt, parameters=None):
+
+    with TraceStore(directory, dt, 's', parameters) as store:
+        writers = (store.getWriter('Vt', 'mV'),
+                   store.getWriter('Pout', 'mM'),
+                   store.getWriter('light', 'mW/mm^2'))
+
+        for (time_array, Vt_array, Pt_out_array, light_array) in chunks:
+            for writer, values in zip(writers, (Vt_array, Pt_out_array, light_array)):
+                writer.extend(values)
+
+    return store.header
+
+
+#same as zapToStore() but the (time, Vt, Pout, light) chunks are reduced while they are recorded, recording
+#is one policy of downsample.py for all three traces ('full', ('decimate', k) or ('envelope', k)) or a list
+#of three policies (Vt, Pout, light). Returns the three recorders: recorder.view() are the kept values and
+#recorder.getIndices()*dt their times
+def zapToRecorders(chunks, recording):
+
+    policies = recording if isinstance(recording, list) else [recording]*3
+    recorders = tuple(makeRecorder(policy) for policy in policies)
+
+    for (time_array, Vt_array, Pt_out_array, light_array) in chunks:
+        for recorder, values in zip(recorders, (Vt_array, Pt_out_array, light_array)):
+            recorder.extend(values)
+
+    for recorder in recorders:
+        recorder.flush()
+
+    return recorders
+
+
+# =============================================================================
+#  zapVectorizedBatch() runs zapVectorized() for many configurations at once.
+#  Vbs and channels are broadcast against each other, the outputs have shape
+#  (n_configs, n_steps) with one row per (Vb, channels) pair. The rows are run
+#  one by one on purpose: each row only computes its head and one reset cycle
+#  and repeats it, while a table broadcast over all configurations has to be as
+#  long as the longest head (a configuration that never fires), which measured
+#  about twice as slow for mixed batches
+# =============================================================================
+def zapVectorizedBatch(Vbs, channels, Vrest, Vmax, dt, n_steps, calcium_model, photon_emiter):
+
+    Vbs, channels = np.broadcast_arrays(np.asarray(Vbs, dtype=float), np.asarray(channels))
+    Vbs = Vbs.ravel()
+    channels = channels.ravel()
+
+    Vt_array = np.empty((len(Vbs), n_steps))
+    Pt_out_array = np.empty((len(Vbs), n_steps))
+    light_array = np.empty((len(Vbs), n_steps))
+
+    #every row is written in place, identical configurations are only run once
+    done = {}
+    for i, (Vb, chan) in enumerate(zip(Vbs, channels)):
+        key = (Vb, int(chan))
+        if key in done:
+            j = done[key]
+            Vt_array[i], Pt_out_array[i], light_array[i] = Vt_array[j], Pt_out_array[j], light_array[j]
+        else:
+            zapVectorized(Vb, int(chan), Vrest, Vmax, dt, n_steps, calcium_model, photon_emiter,
+                          out=(Vt_array[i], Pt_out_array[i], light_array[i]))
+            done[key] = i
+
+    return (Vt_array,
+            Pt_out_array,
+            light_array)
+
+
+# =============================================================================
+#  averageTopLight() is the light intensity handed to the neuron: the mean of
+#  the highest cut_off percent of the light trace (mW/mm^2). light_array can
+#  be a np.memmap of a trace store, it is partitioned, never fully sorted
+# =============================================================================
+def averageTopLight(light_array, cut_off=5):
+
+    light_array = np.asarray(light_array)
+    count = max((cut_off*len(light_array))//100, 1)
+    top = np.partition(light_array, len(light_array) - count)[len(light_array) - count:]
+
+    return float(top.sum()/count)
@@ -56,3 +56,6 @@ class Channelrhodopsin:
                     
     def getI(self):
         return self.I_ChR2
+    
+    def setI(self, I_ChR2):
+        self.I_ChR2 = I_ChR2
@@ -0,0 +1,250 @@
+"""
+Recording policies that reduce long traces while they are being recorded
+
+    'full'              every sample
+    ('decimate', k)     every k-th sample
+    ('envelope', k)     the minimum and maximum of every bin of k samples, in the
+                        order they occurred, so spikes and SER resets survive
+    ('lttb', k)         one sample of every bucket of k samples, the one spanning the
+                        largest triangle with its neighbours (largest-triangle-three-
+                        buckets), only for traces already in memory, see downsample()
+
+makeRecorder(policy) returns a recorder with the usual append/extend/view/clear
+interface (see recorder.py). getIndices() gives the position of every kept
+sample in the original trace (time = index*dt). Output samples go to a target
+recorder (a ChunkedRecorder unless another one is given) and, if a listener is
+set, to listener(indices, values) as soon as they are produced, e.g. to plot
+them on a vpython gcurve.
+"""
+import numpy as np
+from recorder import ChunkedRecorder
+
+
+class DecimatingRecorder:
+
+    def __init__(self, every, target=None, index_target=None, listener=None):
+
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        self.every = every
+        self.target = ChunkedRecorder() if target is None else target
+        self.index_target = ChunkedRecorder(dtype=np.int64) if index_target is None else index_target
+        self.listener = listener
+        #number of samples seen so far
+        self.total = 0
+
+    def append(self, value):
+        if self.total % self.every == 0:
+            self.output(np.array([self.total]), np.array([value], dtype=float))
+        self.total += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=float)
+        first = (-self.total) % self.every
+        kept = values[first::self.every]
+        if len(kept):
+            self.output(self.total + first + np.arange(len(kept))*self.every, kept)
+        self.total += len(values)
+
+    def output(self, indices, values):
+        self.target.extend(values)
+        self.index_target.extend(indices)
+        if self.listener is not None:
+            self.listener(indices, values)
+
+    #nothing is held back, kept for the same interface as EnvelopeRecorder
+    def flush(self):
+        pass
+
+    def view(self):
+        return self.target.view()
+
+    def getIndices(self):
+        return self.index_target.view()
+
+    def clear(self):
+        self.target.clear()
+        self.index_target.clear()
+        self.total = 0
+
+    def __len__(self):
+        return len(self.target)
+
+
+class EnvelopeRecorder:
+
+    def __init__(self, bin_size, target=None, index_target=None, listener=None):
+
+        if bin_size < 1:
+            raise ValueError("bin_size must be at least 1")
+        self.bin_size = bin_size
+        self.target = ChunkedRecorder() if target is None else target
+        self.index_target = ChunkedRecorder(dtype=np.int64) if index_target is None else index_target
+        self.listener = listener
+        self.total = 0
+        #minimum and maximum of the bin that is still being filled
+        self.count = 0
+        self.low = self.high = 0.0
+        self.low_index = self.high_index = 0
+
+    def append(self, value):
+
+        if self.count == 0 or value < self.low:
+            self.low = value
+            self.low_index = self.total
+        if self.count == 0 or value > self.high:
+            self.high = value
+            self.high_index = self.total
+
+        self.count += 1
+        self.total += 1
+        if self.count == self.bin_size:
+            self.output(*self.getPartialBin())
+            self.count = 0
+
+    def extend(self, values):
+
+        values = np.asarray(values, dtype=float)
+
+        #complete the bin that is being filled sample by sample
+        start = 0
+        if self.count:
+            start = min(self.bin_size - self.count, len(values))
+            for value in values[:start]:
+                self.append(value)
+
+        #whole bins at once
+        n_bins = (len(values) - start)//self.bin_size
+        if n_bins:
+            end = start + n_bins*self.bin_size
+            bins = values[start:end].reshape(n_bins, self.bin_size)
+            rows = np.arange(n_bins)
+            low = bins.argmin(axis=1)
+            high = bins.argmax(axis=1)
+            first = np.minimum(low, high)
+            second = np.maximum(low, high)
+
+            indices = np.empty(2*n_bins, dtype=np.int64)
+            indices[0::2] = first
+            indices[1::2] = second
+            indices += self.total + np.repeat(rows*self.bin_size, 2)
+            envelope = np.empty(2*n_bins)
+            envelope[0::2] = bins[rows, first]
+            envelope[1::2] = bins[rows, second]
+
+            self.total += n_bins*self.bin_size
+            self.output(indices, envelope)
+            start = end
+
+        for value in values[start:]:
+            self.append(value)
+
+    #(indices, values) of the min and max of the bin being filled, in time order
+    def getPartialBin(self):
+        if self.count == 0:
+            return (np.empty(0, dtype=np.int64), np.empty(0))
+        if self.low_index <= self.high_index:
+            return (np.array([self.low_index, self.high_index]), np.array([self.low, self.high], dtype=float))
+        return (np.array([self.high_index, self.low_index]), np.array([self.high, self.low], dtype=float))
+
+    def output(self, indices, values):
+        self.target.extend(values)
+        self.index_target.extend(indices)
+        if self.listener is not None:
+            self.listener(indices, values)
+
+    #emits the bin that is still being filled, e.g. at the end of a run
+    def flush(self):
+        if self.count:
+            self.output(*self.getPartialBin())
+            self.count = 0
+
+    #everything recorded, including the envelope of the bin being filled
+    def view(self):
+        return np.concatenate((self.target.view(), self.getPartialBin()[1]))
+
+    def getIndices(self):
+        return np.concatenate((self.index_target.view(), self.getPartialBin()[0]))
+
+    def clear(self):
+        self.target.clear()
+        self.index_target.clear()
+        self.total = 0
+        self.count = 0
+
+    def __len__(self):
+        return len(self.target) + (2 if self.count else 0)
+
+
+#policy is 'full', ('decimate', k) or ('envelope', k)
+def makeRecorder(policy='full', target=None, index_target=None, listener=None):
+
+    if policy == 'full':
+        return DecimatingRecorder(1, target, index_target, listener)
+
+    name, factor = policy
+    if name == 'decimate':
+        return DecimatingRecorder(factor, target, index_target, listener)
+    if name == 'envelope' and factor == 1:
+        return DecimatingRecorder(1, target, index_target, listener)
+    if name == 'envelope':
+        return EnvelopeRecorder(factor, target, index_target, listener)
+    if name == 'lttb':
+        raise ValueError("lttb needs the whole trace, use downsample()")
+    raise ValueError("unknown recording policy: " + str(policy))
+
+
+#applies a policy to a trace that is already in memory, returns (indices, values)
+def downsample(values, policy):
+
+    if policy != 'full' and policy[0] == 'lttb':
+        return lttb(values, policy[1])
+    recorder = makeRecorder(policy)
+    recorder.extend(values)
+    recorder.flush()
+    return (recorder.getIndices(), recorder.view())
+
+
+#bin size of an envelope that fits n_samples into about `pixels` screen columns
+def envelopeForPixels(n_samples, pixels):
+    return ('envelope', max(1, int(n_samples)//max(1, int(pixels))))
+
+
+#bucket size of an LTTB reduction that fits n_samples into about `pixels` points
+def lttbForPixels(n_samples, pixels):
+    return ('lttb', max(1, int(n_samples)//max(1, int(pixels))))
+
+
+#largest-triangle-three-buckets: keeps the first and the last sample and, of every bucket
+#of bucket_size samples in between, the one spanning the largest triangle with the sample
+#kept before it and the mean of the next bucket; returns (indices, values)
+def lttb(values, bucket_size):
+
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if bucket_size < 1:
+        raise ValueError("bucket_size must be at least 1")
+    if bucket_size == 1 or n <= 2:
+        return (np.arange(n), values.copy())
+
+    #bucket i holds the samples edges[i] to edges[i+1]-1
+    edges = np.append(np.arange(1, n - 1, bucket_size), n - 1)
+    n_buckets = len(edges) - 1
+    kept = np.empty(n_buckets + 2, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+
+    a = 0
+    for i in range(n_buckets):
+        start, end = edges[i], edges[i + 1]
+        if i + 1 < n_buckets:
+            mean_x = (edges[i + 1] + edges[i + 2] - 1)/2
+            mean_y = values[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            mean_x, mean_y = n - 1, values[n - 1]
+        #twice the triangle areas, the factor does not change the choice
+        area = np.abs((a - mean_x)*(values[start:end] - values[a]) - (a - np.arange(start, end))*(mean_y - values[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+
+    return (kept, values[kept])
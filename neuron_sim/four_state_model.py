@@ -9,9 +9,14 @@ Created on Sun Nov  6 17:33:32 2022
 """
 
 import math
-import matplotlib.pyplot as plt
+import numpy as np
+from propagator import expm, PropagatorCache
+from recorder import ChunkedRecorder
 from izhikevich import Izhikevich
 
+# Q10 factors of Gd1, Gr, e12, e21, Gd2, ep1 and ep2
+Q10_FACTORS = (1.97, 2.56, 1.1, 1.95, 1.77, 1.46, 2.77)
+
 class FourStateModel:
     def __init__(self, gamma, Gd2, ep1, ep2, sigma_ret, w_loss, T_ChR2):
         self.gamma = gamma
@@ -29,7 +34,24 @@ class FourStateModel:
         self.o1 = 0.0
         self.o2 = 0.0
         self.p = 0
-        self.Is = []
+        # recorder of the photocurrent after every step, see setRecorder
+        self.Is = ChunkedRecorder()
+        # 'euler' or 'exponential', see setIntegrator
+        self.integrator = 'euler'
+        # exponential integrator: longest sub-step while p is still relaxing (ms)
+        # and distance to So below which p counts as settled
+        self.transient_step = 0.05
+        self.p_tolerance = 1e-9
+        self.propagators = PropagatorCache()
+        # Q10 factors for the current (temp, temp_scale), see getQ10
+        self.q10_key = None
+        self.q10 = None
+        # rates of the last voltage and light terms of the last irradiance, under voltage
+        # clamp and constant light they are computed once instead of every step
+        self.voltage_key = None
+        self.voltage_rates = None
+        self.light_key = None
+        self.light_terms = None
 
     def getC1(self):
         return self.c1
@@ -43,21 +65,34 @@ class FourStateModel:
     def getO2(self):
         return self.o2
     
+    # Q10 temperature factors in the order of Q10_FACTORS, only recomputed when temp or
+    # temp_scale have changed since the last call
+    def getQ10(self):
+        if self.q10_key != (self.temp, self.temp_scale):
+            self.q10_key = (self.temp, self.temp_scale)
+            if self.temp_scale:
+                self.q10 = tuple(factor**((self.temp-22)/10) for factor in Q10_FACTORS)
+            else:
+                self.q10 = (1,)*len(Q10_FACTORS)
+        return self.q10
+    
     # rate constant for O1->C1 transition: 0.084, 0.108, 0.11
     def Gd1(self, v): #ms^(-1)
         gd1 = 0.075 + 0.043 * math.tanh((v+20)/(-20))
-        if self.temp_scale:
-            return gd1*(1.97**((self.temp-22)/10))
-        else:
-            return gd1
+        return gd1*self.getQ10()[0]
 
     # rate constant for C2->C1 transition: 0.004, 0.0004
     def Gr(self, v): #ms^(-1)
         gr = (4.34587 * (10**-5) * math.exp(-0.0211539274*v))
-        if self.temp_scale:
-            return gr*(2.56**((self.temp-22)/10))
-        else:
-            return gr
+        return gr*self.getQ10()[1]
+    
+    # (Gd1, Gr) at voltage V, reused while V and the temperature stay the same
+    def getVoltageRates(self, V):
+        key = (V, self.temp, self.temp_scale)
+        if key != self.voltage_key:
+            self.voltage_key = key
+            self.voltage_rates = (self.Gd1(V), self.Gr(V))
+        return self.voltage_rates
     
     def logphi(self, irradiance):
         if (irradiance>0):
@@ -68,18 +103,12 @@ class FourStateModel:
     # rate constant for O1->O2 transition: e12d = 0.011, 0.0297, 0.03, 0.0
     def e12(self, logphi0): #ms^(-1)
         e12d = 0.011
-        if self.temp_scale:
-            return e12d*(1.1**((self.temp-22)/10)) + 0.005*logphi0
-        else:
-            return e12d + 0.005*logphi0
+        return e12d*self.getQ10()[2] + 0.005*logphi0
 
     # rate constant for O2->O1 transition: e21d = 0.008, 0.018, 0, 0.015
     def e21(self, logphi0): #ms^(-1)
         e21d = 0.008
-        if self.temp_scale:
-            return e21d*(1.95**((self.temp-22)/10)) + 0.004*logphi0
-        else:
-            return e21d + 0.004*logphi0
+        return e21d*self.getQ10()[3] + 0.004*logphi0
     
     # photon flux, number of photons per molecule per second
     def F(self, irr, wavelength): #ms^(-1)
@@ -92,37 +121,64 @@ class FourStateModel:
         theta = 100*irr
         return 0.5 * (1 + math.tanh(120 * (theta - 0.1)))
     
+    # (So, logphi, F) for an irradiance and wavelength, reused while the light stays the same
+    def getLightTerms(self, irr, wavelength):
+        key = (irr, wavelength, self.sigma_ret, self.w_loss)
+        if key != self.light_key:
+            self.light_key = key
+            self.light_terms = (self.So(irr), self.logphi(irr), self.F(irr, wavelength))
+        return self.light_terms
+    
     def reset(self):
         self.c1 = 1.0
         self.o1 = 0.0
         self.o2 = 0.0
         self.c2 = 0.0
         self.p = 0
-        self.Is = []
+        self.Is.clear()
+        self.propagators.clear()
     
-    def getPhotocurrent(self, irr, V, dt, wavelength, g_ChR2, E_ChR2):   
-        Gd1 = self.Gd1(V)
-        logphi0 = self.logphi(irr)
+    # rate constants of the C1/O1/O2/C2 transitions for a given irradiance and voltage,
+    # a1 and a2 are the light-driven C1->O1 and C2->O2 rates per unit of p
+    def getRates(self, irr, V, wavelength):
+        Gd1, Gr = self.getVoltageRates(V)
+        So, logphi0, F = self.getLightTerms(irr, wavelength)
+        q10 = self.getQ10()
         e12 = self.e12(logphi0)
         e21 = self.e21(logphi0)
-        F = self.F(irr, wavelength)
-        Gr = self.Gr(V)
-        Gd2 = self.Gd2
-        ep1 = self.ep1
-        ep2 = self.ep2
+        Gd2 = self.Gd2*q10[4]
+        ep1 = self.ep1*q10[5]
+        ep2 = self.ep2*q10[6]
         
-        if self.temp_scale:
-            Gd2 = Gd2*(1.77**((self.temp-22)/10))
-            ep1 = ep1*(1.46**((self.temp-22)/10))
-            ep2 = ep2*(2.77**((self.temp-22)/10))
+        return (Gd1, e12, e21, Gr, Gd2, ep1*F, ep2*F)
+    
+    # generator matrix of d[c1, o1, o2, c2]/dt for a fixed p, every column sums to zero
+    def getGenerator(self, irr, V, wavelength, p):
+        Gd1, e12, e21, Gr, Gd2, a1, a2 = self.getRates(irr, V, wavelength)
+        a1 = a1*p
+        a2 = a2*p
+        return np.array([[-a1, Gd1,         0.0,          Gr       ],
+                         [ a1, -(Gd1+e12),  e21,          0.0      ],
+                         [0.0, e12,         -(Gd2+e21),   a2       ],
+                         [0.0, 0.0,         Gd2,          -(a2+Gr) ]])
+    
+    # 'euler' is the original forward Euler update, 'exponential' advances the
+    # states with the exact propagator expm(A*dt) and stays accurate at large dt
+    def setIntegrator(self, integrator):
+        if integrator not in ('euler', 'exponential'):
+            raise ValueError("unknown integrator: " + str(integrator))
+        self.integrator = integrator
+    
+    def eulerStep(self, irr, V, dt, wavelength):
+        Gd1, e12, e21, Gr, Gd2, a1, a2 = self.getRates(irr, V, wavelength)
         
-        dP = (self.So(irr) - self.p)/self.T_ChR2
-        dC1O1 = ep1*F*self.p*self.c1
+        dP = (self.getLightTerms(irr, wavelength)[0] - self.p)/self.T_ChR2
+        dC1O1 = a1*self.p*self.c1
         dO1C1 = Gd1*self.o1
         dO1O2 = e12*self.o1
         dO2O1 = e21*self.o2
         dO2C2 = Gd2*self.o2
-        dC2O2 = ep2*F*self.p*self.c2
+        dC2O2 = a2*self.p*self.c2
         dC2C1 = Gr*self.c2
         dC1  =  dC2C1 + dO1C1 - dC1O1
         dO1  =  dC1O1 + dO2O1 - dO1C1 - dO1O2
@@ -135,17 +191,86 @@ class FourStateModel:
         self.o2 += dO2*dt
         self.c2 += dC2*dt
         self.p += dP*dt
-                
+    
+    # With irr and V constant, p relaxes exactly as p(t) = So + (p0-So)exp(-t/T_ChR2)
+    # and the four states follow a linear system whose rates depend on p. While p is
+    # still relaxing the step is split into sub-steps of at most transient_step with
+    # p frozen at its exact mean over the sub-step; once p has settled the whole
+    # remaining step is one matrix product with a cached propagator.
+    def exponentialStep(self, irr, V, dt, wavelength):
+        So = self.getLightTerms(irr, wavelength)[0]
+        state = np.array([self.c1, self.o1, self.o2, self.c2])
+        
+        remaining = dt
+        while remaining > 0:
+            delta = self.p - So
+            if abs(delta) > self.p_tolerance:
+                h = min(remaining, self.transient_step)
+                decay = math.exp(-h/self.T_ChR2)
+                p_mean = So + delta*self.T_ChR2*(1 - decay)/h
+                propagator = expm(self.getGenerator(irr, V, wavelength, p_mean)*h)
+            else:
+                h = remaining
+                decay = math.exp(-h/self.T_ChR2)
+                # every parameter the generator depends on is part of the key, so assigning
+                # e.g. model.sigma_ret directly never reuses a propagator of the old value
+                key = (irr, V, wavelength, h, self.temp, self.temp_scale,
+                       self.Gd2, self.ep1, self.ep2, self.sigma_ret, self.w_loss)
+                propagator = self.propagators.get(key, lambda: self.getGenerator(irr, V, wavelength, So), h)
+            
+            state = propagator @ state
+            self.p = So + delta*decay
+            remaining -= h
+        
+        # the propagator conserves c1+o1+o2+c2, renormalizing removes rounding drift
+        state /= state.sum()
+        self.c1, self.o1, self.o2, self.c2 = (float(x) for x in state)
+    
+    # photocurrent per unit of open fraction (o1 + gamma*o2) at voltage V
+    def getCurrentScale(self, V, g_ChR2):
         A = +10.6408
         B = -14.6408
         C = +42.7671
-        I_ChR2 = g_ChR2 * ((A+B*math.exp(-V/C))) * (self.o1 + self.gamma * self.o2)
+        return g_ChR2 * ((A+B*math.exp(-V/C)))
+    
+    def getPhotocurrent(self, irr, V, dt, wavelength, g_ChR2, E_ChR2):   
+        if self.integrator == 'exponential':
+            self.exponentialStep(irr, V, dt, wavelength)
+        else:
+            self.eulerStep(irr, V, dt, wavelength)
+                
+        I_ChR2 = self.getCurrentScale(V, g_ChR2) * (self.o1 + self.gamma * self.o2)
         
         self.Is.append(I_ChR2)
         
         return I_ChR2
     
+    # set the channel states directly, e.g. after an interval advanced by simulation.FastForward
+    def setState(self, c1, o1, o2, c2, p):
+        self.c1 = c1
+        self.o1 = o1
+        self.o2 = o2
+        self.c2 = c2
+        self.p = p
+    
+    # attach a recorder (recorder.RingRecorder, recorder.ChunkedRecorder or
+    # trace_store.TraceWriter) to the photocurrent 'I'
+    def setRecorder(self, variable, recorder):
+        if variable == 'I':
+            self.Is = recorder
+        else:
+            raise ValueError("unknown variable: " + str(variable))
+    
+    def setTraceWriter(self, writer):
+        self.setRecorder('I', writer)
+    
+    # append photocurrents computed elsewhere (e.g. a fast-forwarded interval) to the trace
+    def extendTrace(self, values):
+        self.Is.extend(values)
+    
     def getPlot(self):
+        # matplotlib is only imported here, the model itself needs nothing but NumPy
+        import matplotlib.pyplot as plt
         fig = plt.figure(figsize=(12,9), dpi=180)
-        plt.plot(self.Is)
+        plt.plot(self.Is.view())
         plt.show()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized Williams et Al Four-State Model for a population of neurons
+
+Same rate constants and update rule as four_state_model.py, but the state
+(c1, o1, o2, c2, p) is held in NumPy arrays and every step takes irradiance,
+voltage and wavelength arrays, so a population under a spatially varying
+light field is advanced with one set of array operations.
+
+"""
+import numpy as np
+
+class FourStatePopulation:
+    def __init__(self, size, gamma, Gd2, ep1, ep2, sigma_ret, w_loss, T_ChR2):
+        self.size = size
+        self.gamma = gamma
+        self.Gd2 = Gd2
+        self.ep1 = ep1
+        self.ep2 = ep2
+        self.sigma_ret = sigma_ret
+        self.w_loss = w_loss
+        self.hc = 1.986446*(10**(-25))
+        self.T_ChR2 = T_ChR2
+        self.temp = 22
+        self.temp_scale = True
+        self.reset()
+
+    def reset(self):
+        self.c1 = np.ones(self.size)
+        self.o1 = np.zeros(self.size)
+        self.o2 = np.zeros(self.size)
+        self.c2 = np.zeros(self.size)
+        self.p = np.zeros(self.size)
+        self.I = np.zeros(self.size)
+
+    # Q10 temperature factor, 1 when temperature scaling is off
+    def q10(self, factor):
+        if self.temp_scale:
+            return factor**((self.temp-22)/10)
+        return 1.0
+
+    # rate constant for O1->C1 transition
+    def Gd1(self, v): #ms^(-1)
+        return (0.075 + 0.043 * np.tanh((v+20)/(-20))) * self.q10(1.97)
+
+    # rate constant for C2->C1 transition
+    def Gr(self, v): #ms^(-1)
+        return (4.34587 * (10**-5) * np.exp(-0.0211539274*v)) * self.q10(2.56)
+
+    def logphi(self, irradiance):
+        return np.log(1 + np.maximum(irradiance, 0)/0.024)
+
+    # rate constant for O1->O2 transition
+    def e12(self, logphi0): #ms^(-1)
+        return 0.011*self.q10(1.1) + 0.005*logphi0
+
+    # rate constant for O2->O1 transition
+    def e21(self, logphi0): #ms^(-1)
+        return 0.008*self.q10(1.95) + 0.004*logphi0
+
+    # photon flux, number of photons per molecule per second
+    def F(self, irr, wavelength): #ms^(-1)
+        Ephoton = (1*(10**9)) * self.hc / wavelength #J
+        flux = 1000*irr/Ephoton #W/m^2
+        return (flux*self.sigma_ret/(self.w_loss*1000))
+
+    # state-variable, time- and irradiance-dependent activation function for ChR2
+    def So(self, irr):
+        theta = 100*irr
+        return 0.5 * (1 + np.tanh(120 * (theta - 0.1)))
+
+    # advance every channel population by dt; irr, V and wavelength are scalars
+    # or one value per neuron, returns the photocurrent of every neuron
+    def getPhotocurrent(self, irr, V, dt, wavelength, g_ChR2, E_ChR2):
+        irr = np.asarray(irr, dtype=float)
+        V = np.asarray(V, dtype=float)
+
+        Gd1 = self.Gd1(V)
+        logphi0 = self.logphi(irr)
+        e12 = self.e12(logphi0)
+        e21 = self.e21(logphi0)
+        F = self.F(irr, np.asarray(wavelength, dtype=float))
+        Gr = self.Gr(V)
+        Gd2 = self.Gd2*self.q10(1.77)
+        ep1 = self.ep1*self.q10(1.46)
+        ep2 = self.ep2*self.q10(2.77)
+
+        dP = (self.So(irr) - self.p)/self.T_ChR2
+        dC1O1 = ep1*F*self.p*self.c1
+        dO1C1 = Gd1*self.o1
+        dO1O2 = e12*self.o1
+        dO2O1 = e21*self.o2
+        dO2C2 = Gd2*self.o2
+        dC2O2 = ep2*F*self.p*self.c2
+        dC2C1 = Gr*self.c2
+        dC1  =  dC2C1 + dO1C1 - dC1O1
+        dO1  =  dC1O1 + dO2O1 - dO1C1 - dO1O2
+        dO2  =  dC2O2 + dO1O2 - dO2C2 - dO2O1
+        dC2  =  dO2C2 - dC2O2 - dC2C1
+
+        # apply changes multiplied by the time step
+        self.c1 = self.c1 + dC1*dt
+        self.o1 = self.o1 + dO1*dt
+        self.o2 = self.o2 + dO2*dt
+        self.c2 = self.c2 + dC2*dt
+        self.p = self.p + dP*dt
+
+        A = +10.6408
+        B = -14.6408
+        C = +42.7671
+        self.I = g_ChR2 * ((A+B*np.exp(-V/C))) * (self.o1 + self.gamma * self.o2)
+
+        return self.I
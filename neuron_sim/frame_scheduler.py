@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frame scheduling for the interactive views, no vpython
+
+Drawing is far slower than a physics step, so the viewers run a batch of
+physics steps per rendered frame and only then update the labels, the 3D
+objects and the graphs. FrameScheduler picks the batch size:
+
+    - a fixed number of steps per frame (steps_per_frame), or
+    - adaptively, as many steps as fit in a frame of target_fps after the
+      measured drawing time, from the measured cost of a step
+
+and sim_speed (simulated ms per second, 1000.0 is real time) caps the batch
+so the view does not run faster than asked. Every frame is
+
+    steps = scheduler.startFrame()
+    ... at most steps time steps, count the ones actually stepped ...
+    scheduler.physicsDone(stepped)
+    ... draw ...
+    scheduler.endFrame()
+    rate(scheduler.target_fps)
+
+PlotBuffer collects what a graph recorder emits during a frame (see
+downsample.makeRecorder) and plots it on a gcurve in one call.
+
+"""
+import time
+import numpy as np
+
+class FrameScheduler:
+    def __init__(self, dt, steps_per_frame=None, target_fps=30.0, sim_speed=None, max_steps=100000):
+        self.dt = dt
+        # fixed batch size, None adapts it to target_fps
+        self.steps_per_frame = steps_per_frame
+        self.target_fps = target_fps
+        # simulated ms per wall-clock second at most, None runs as fast as target_fps allows
+        self.sim_speed = sim_speed
+        self.max_steps = max_steps
+        # weight of the newest measurement in the running averages
+        self.smoothing = 0.2
+        self.steps = 1
+        # running averages: seconds per physics step, seconds of drawing per frame, frames per second
+        self.step_time = None
+        self.render_time = 0.0
+        self.frame_rate = None
+        self.frame_start = None
+        self.physics_end = None
+
+    def average(self, mean, value):
+        if mean is None:
+            return value
+        return mean + self.smoothing*(value - mean)
+
+    # number of time steps for the next frame
+    def getSteps(self):
+        if self.steps_per_frame is not None:
+            steps = self.steps_per_frame
+        elif self.step_time is None:
+            steps = self.steps
+        else:
+            # at least a tenth of the frame goes to the physics even if drawing is slower than
+            # target_fps, and the batch at most doubles per frame so one slow frame cannot follow
+            budget = max(1.0/self.target_fps - self.render_time, 0.1/self.target_fps)
+            steps = min(budget/self.step_time, 2*self.steps)
+        if self.sim_speed is not None:
+            steps = min(steps, self.sim_speed/(self.target_fps*self.dt))
+        self.steps = int(max(1, min(steps, self.max_steps)))
+        return self.steps
+
+    # call at the start of every frame, returns the number of time steps to run
+    def startFrame(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.frame_rate = self.average(self.frame_rate, 1.0/max(now - self.frame_start, 1e-9))
+        self.frame_start = now
+        self.physics_end = None
+        return self.getSteps()
+
+    # call between the physics and the drawing with the number of steps taken one by one,
+    # intervals jumped over by simulation.FastForward do not count towards the step cost
+    def physicsDone(self, stepped):
+        self.physics_end = time.perf_counter()
+        if stepped > 0:
+            self.step_time = self.average(self.step_time, (self.physics_end - self.frame_start)/stepped)
+
+    # call after the drawing, before waiting for the next frame
+    def endFrame(self):
+        if self.physics_end is not None:
+            self.render_time = self.average(self.render_time, time.perf_counter() - self.physics_end)
+
+    # measured frames per second
+    def getFrameRate(self):
+        return self.frame_rate or 0.0
+
+    # simulated ms per wall-clock second at the current batch size and frame rate
+    def getSimSpeed(self):
+        return self.steps*self.dt*self.getFrameRate()
+
+    # start the frame timing over, e.g. after the simulation was paused
+    def reset(self):
+        self.frame_start = None
+        self.physics_end = None
+
+class PlotBuffer:
+    def __init__(self, dt):
+        self.dt = dt
+        self.indices = []
+        self.values = []
+
+    # listener for downsample.makeRecorder, collects the samples until flush
+    def add(self, indices, values):
+        self.indices.append(indices)
+        self.values.append(values)
+
+    # [(t, value), ...] of the collected samples, empties the buffer
+    def getPoints(self):
+        if not self.values:
+            return []
+        indices = np.concatenate(self.indices)
+        values = np.concatenate(self.values)
+        self.indices = []
+        self.values = []
+        return list(zip((indices*self.dt).tolist(), values.tolist()))
+
+    # plots the collected samples on a vpython gcurve in one call
+    def flush(self, curve):
+        points = self.getPoints()
+        if points:
+            curve.plot(points)
+
+    def clear(self):
+        self.indices = []
+        self.values = []
@@ -0,0 +1,97 @@
+"""
+Import time of the model modules
+
+Every module is imported in a fresh interpreter (NumPy is imported first and
+timed on its own, since every module needs it) and the best of `repeat` runs
+is reported together with the heavy optional packages (matplotlib, vpython,
+openpyxl) the import pulled in. The model modules should load none of them,
+matplotlib is only imported by the plotting methods. The 3D modules are built
+on vpython and import it up front, they are timed but not checked.
+
+    python import_times.py                  table for the modules in this folder
+    python import_times.py --json out.json  also write the numbers, to track them over time
+    python import_times.py --check          exit with 1 if a model module loads a heavy package
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+#modules that must import with NumPy and the standard library only
+model_modules = ['izhikevich', 'izhikevich_population', 'four_state_model', 'four_state_population',
+                 'channelrhodopsin', 'propagator', 'simulation', 'adaptive', 'voltage_clamp', 'headless',
+                 'frame_scheduler', 'recorder', 'downsample', 'trace_store', 'ser', 'calcium', 'photon_emission', 'M13',
+                 'light_transfer', 'zap_engine', 'zap_cache', 'file_hash', 'pipeline']
+
+#3D classes, vpython is part of what they cost to import
+graphics_modules = ['neuron', 'ser_3D', 'M13_3D']
+
+heavy_packages = ['matplotlib', 'vpython', 'openpyxl']
+
+timing_code = """
+import json, sys, time
+import numpy
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name in %r if name in sys.modules]]))
+"""
+
+numpy_code = """
+import json, time
+start = time.perf_counter()
+import numpy
+print(json.dumps([time.perf_counter() - start, []]))
+"""
+
+
+#(seconds, heavy packages loaded) of the best of repeat imports in fresh interpreters
+def measure(code, directory, repeat):
+
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=directory, capture_output=True, text=True)
+        if output.returncode != 0:
+            return (None, output.stderr.strip().splitlines()[-1])
+        elapsed, loaded = json.loads(output.stdout.strip().splitlines()[-1])
+        if best is None or elapsed < best[0]:
+            best = (elapsed, loaded)
+    return best
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Measures the import time of the model modules.')
+    parser.add_argument('--directory', default=os.path.dirname(os.path.abspath(__file__)), help='folder of the modules')
+    parser.add_argument('--repeat', type=int, default=3, help='imports per module, the fastest counts (default: 3)')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--check', action='store_true', help='fail if a model module loads a heavy package')
+    args = parser.parse_args(argv)
+
+    results = {'numpy': measure(numpy_code, args.directory, args.repeat)}
+    for name in model_modules + graphics_modules:
+        if os.path.exists(os.path.join(args.directory, name + '.py')):
+            results[name] = measure(timing_code % (name, heavy_packages), args.directory, args.repeat)
+
+    failed = []
+    for name, (elapsed, loaded) in results.items():
+        if elapsed is None:
+            print('%-24s failed: %s' % (name, loaded))
+        else:
+            print('%-24s %8.1f ms   %s' % (name, elapsed*1000, ', '.join(loaded)))
+        #the 3D modules need vpython, only the model modules have to import without it
+        if name in model_modules and (elapsed is None or loaded):
+            failed.append(name)
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({name: {'seconds': elapsed, 'loaded': loaded} for name, (elapsed, loaded) in results.items()},
+                      json_file, indent=2)
+
+    return 1 if (args.check and failed) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
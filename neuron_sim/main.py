@@ -12,8 +12,12 @@ from neuron import Neuron
 from izhikevich import Izhikevich
 from channelrhodopsin import Channelrhodopsin
 from four_state_model import FourStateModel
+from simulation import LightProtocol
+from headless import HeadlessSimulation
+from frame_scheduler import FrameScheduler, PlotBuffer
+from recorder import RingRecorder
+from downsample import makeRecorder, envelopeForPixels
 from vpython import *
-import copy
 
 # =============================================================================
 # Simulation Variables
@@ -25,17 +29,21 @@ sim_time = 600.0
 # simulate consecutive light pulses by setting single_pulse to False, not incorportated into control panel
 init_pulse_times = [0, 20, 40]
 init_pulse_widths = [6, 6, 6]
-pulse_times = copy.copy(init_pulse_times)
-pulse_widths = copy.copy(init_pulse_widths)
 single_pulse = True
 
 light_delay = 100 # ms
 pulse_width = 400 # ms
 light_intensity = 5.5 # mW/mm^2
 wavelength = 470 # nm
-if not single_pulse:
-    light_delay = pulse_times.pop(0)
-    pulse_width = pulse_widths.pop(0)
+
+# jump over dark intervals in which the neuron is at rest instead of stepping every dt
+fast_forward_enabled = True
+
+# physics steps per rendered frame, None fits as many as target_fps allows; sim_speed caps the
+# simulated ms per second (1000.0 is real time, None as fast as the frame rate allows)
+steps_per_frame = None
+target_fps = 30.0
+sim_speed = None
 
 # =============================================================================
 # Initialize Graphs
@@ -84,6 +92,15 @@ w_loss = 1.3
 T_ChR2 = 1.3
 four_state_model = FourStateModel(gamma, Gd2, ep1, ep2, sigma_ret, w_loss, T_ChR2)
 
+# =============================================================================
+# Trace Recorders - only the last trace_capacity samples are kept, so memory
+# stays flat however long the interactive session runs
+# =============================================================================
+trace_capacity = 100000
+izhikevich.setRecorder('v', RingRecorder(trace_capacity))
+izhikevich.setRecorder('spike_times', RingRecorder(trace_capacity))
+four_state_model.setRecorder('I', RingRecorder(trace_capacity))
+
 # =============================================================================
 # Create Channelrhodopsin Object
 # =============================================================================
@@ -98,6 +115,56 @@ ChR2 = Channelrhodopsin(four_state_model, dt, E_ChR2, g_ChR2, wavelength, holdin
 soma_radius = 18
 neuron = Neuron(soma_radius, izhikevich, ChR2)
 
+# =============================================================================
+# Light Protocol & the headless simulation that advances the models, the loop
+# below only draws what it computes
+# =============================================================================
+def getLightProtocol():
+    if single_pulse:
+        return LightProtocol([light_delay], [pulse_width], light_intensity)
+    else:
+        return LightProtocol(init_pulse_times, init_pulse_widths, light_intensity)
+
+light_protocol = getLightProtocol()
+runner = HeadlessSimulation(izhikevich, ChR2, light_protocol, dt, fast_forward_enabled)
+scheduler = FrameScheduler(dt, steps_per_frame, target_fps, sim_speed)
+
+# =============================================================================
+# Graph Recording - samples reach the graphs through a recording policy
+# ('full', ('decimate', k) or ('envelope', k), see downsample.py), by default
+# a min/max envelope with about one bin per pixel column of the graphs
+# =============================================================================
+graph_width = 550
+graph_recording = None # None picks the envelope from sim_time and graph_width
+
+# what the recorders emit during a frame is plotted in one call per curve, see drawGraphs
+ChR2_buffer = PlotBuffer(dt)
+neuron_buffer = PlotBuffer(dt)
+light_buffer = PlotBuffer(dt)
+
+def getGraphRecorders():
+    recording = graph_recording or envelopeForPixels(sim_time/dt, graph_width)
+    
+    # the gcurves keep the points, the recorders only hold the last few
+    def graphRecorder(buffer):
+        buffer.clear()
+        return makeRecorder(recording, RingRecorder(4*graph_width), RingRecorder(4*graph_width, int), buffer.add)
+    
+    return (graphRecorder(ChR2_buffer), graphRecorder(neuron_buffer), graphRecorder(light_buffer))
+
+# plot the partially filled envelope bins at the end of the run
+def flushGraphs():
+    for recorder in (ChR2_recorder, neuron_recorder, light_recorder):
+        recorder.flush()
+
+# plot the samples of the last frame, the curves are replaced on reset so they are looked up here
+def drawGraphs():
+    ChR2_buffer.flush(ChR2_plot)
+    neuron_buffer.flush(neuron_plot)
+    light_buffer.flush(light_plot)
+
+ChR2_recorder, neuron_recorder, light_recorder = getGraphRecorders()
+
 # =============================================================================
 # Display for current time & membrane potential
 # =============================================================================
@@ -110,16 +177,8 @@ V_display = label( pos=vec(10,40,0),
 # Return the current Light Intensity
 # =============================================================================
 def getIrradiance():
-    global pulse_times, pulse_widths, light_delay, pulse_width
-    if (not single_pulse) and (len(pulse_times) > 0):
-        if (t > (light_delay + pulse_width)):
-            light_delay = pulse_times.pop(0)
-            pulse_width = pulse_widths.pop(0)
-    if (t < light_delay) or (t > (light_delay + pulse_width)):
-        return 0
-    else:
-        return light_intensity
-
+    return light_protocol.getIrradiance(t)
+    
 # =============================================================================
 # Light Source - for visual representation of input
 # =============================================================================
@@ -134,6 +193,7 @@ light_source = local_light(pos=vector(0,0,(neuron.soma.radius*-1)+100),
 def toggleSim(b):
     global running
     running = not running
+    scheduler.reset()
     if running:
         b.text = 'Stop'
     else:
@@ -143,22 +203,19 @@ button_start = button(text='Start', pos=scene.title_anchor, bind=toggleSim)
 
 # reset the simulation
 def resetSim(b):
-    global t, izhikevich, ChR2, neuron, four_state_model, running, ChR2_graph, ChR2_plot, light_graph, light_plot, neuron_graph, neuron_plot, pulse_times, pulse_widths, light_delay, pulse_width
+    global t, izhikevich, ChR2, neuron, four_state_model, running, ChR2_graph, ChR2_plot, light_graph, light_plot, neuron_graph, neuron_plot, light_protocol, runner, ChR2_recorder, neuron_recorder, light_recorder
     if running:
         running = not running
         button_start.text = 'Start'
     t = 0.0
     
-    if not single_pulse:
-        pulse_times = copy.copy(init_pulse_times)
-        pulse_widths = copy.copy(init_pulse_widths)
-        light_delay = pulse_times.pop(0)
-        pulse_width = pulse_widths.pop(0)
-    
     izhikevich.reset()
     four_state_model.reset()
     ChR2.reset(four_state_model, wavelength, holding_potential)
     neuron.reset(izhikevich, ChR2)
+    light_protocol = getLightProtocol()
+    runner = HeadlessSimulation(izhikevich, ChR2, light_protocol, dt, fast_forward_enabled)
+    ChR2_recorder, neuron_recorder, light_recorder = getGraphRecorders()
     V_display.text = 'Membrane Potential: ' + str(neuron.getMembraneModel().getMembranePotential()) + ' mV \nTime: ' + str(t) + ' ms'
     light_source.visible = False
 
@@ -262,23 +319,53 @@ wavelength_input = winput(bind=setWavelength,
 scene.append_to_caption(' nm\n')
 
 # =============================================================================
-# Loop running the simulation
+# Draw a frame - the label, the light source, the neuron and the graphs are
+# only updated once per frame, not after every time step
+# =============================================================================
+def drawFrame():
+    light_source.visible = getIrradiance() > 0
+    neuron.updateVisuals()
+    V_display.text = 'Membrane Potential: ' + str(neuron.getMembraneModel().getMembranePotential()) + ' mV \nTime: ' + str(t) + ' ms'
+    drawGraphs()
+
+# =============================================================================
+# Loop running the simulation, a batch of time steps per rendered frame
+# (see frame_scheduler.py)
 # =============================================================================
 while True:
     while t < sim_time:
         if running:
-            neuron.nextTimeStep(t, getIrradiance())
-                
-            if getIrradiance() > 0:
-                light_source.visible = True
-            else:
-                light_source.visible = False
+            steps = scheduler.startFrame()
+            done = 0
+            stepped = 0
+            I_frame, v_frame, light_frame = [], [], []
+            while done < steps and t < sim_time:
+                skipped = runner.skip(t, min(t + (steps - done)*dt, sim_time))
+                if skipped is not None:
+                    # the skipped samples are only computed here, for the graphs
+                    I_frame.extend(skipped.getPhotocurrents().tolist())
+                    v_frame.extend(skipped.getMembranePotentials().tolist())
+                    light_frame.extend(skipped.getIrradiances().tolist())
+                    t = skipped.end_time
+                    done += skipped.n_steps
+                    continue
                 
-            V_display.text = 'Membrane Potential: ' + str(neuron.getMembraneModel().getMembranePotential()) + ' mV \nTime: ' + str(t) + ' ms'
+                runner.step(t)
+                I_frame.append(ChR2.getI())
+                v_frame.append(izhikevich.getMembranePotential())
+                light_frame.append(getIrradiance())
+                t += dt
+                done += 1
+                stepped += 1
+            scheduler.physicsDone(stepped)
             
-            # update graphs in real time
-            ChR2_plot.plot([t, neuron.getOpsinModel().getI()])
-            neuron_plot.plot([t, neuron.getMembraneModel().getMembranePotential()])
-            light_plot.plot([t,getIrradiance()])
+            # update graphs once per frame
+            ChR2_recorder.extend(I_frame)
+            neuron_recorder.extend(v_frame)
+            light_recorder.extend(light_frame)
+            if t >= sim_time:
+                flushGraphs()
             
-            t += dt
+            drawFrame()
+            scheduler.endFrame()
+            rate(target_fps)
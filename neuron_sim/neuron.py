@@ -398,6 +398,12 @@ class Neuron:
         self.opsin_model.nextTimeStep(self.membrane_model.getMembranePotential(), irradiance)
         
         self.membrane_model.updateMembranePotential(t, abs(self.opsin_model.getI()))
+        self.updateVisuals()
+    
+    # =============================================================================
+    # Shows the state of the models after a step, e.g. one taken by headless.HeadlessSimulation
+    # =============================================================================
+    def updateVisuals(self):
         self.apVisual(self.membrane_model.isSpiking())
         self.opsinStateVisual()
             
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event-driven helpers for the neuron simulation loop
+
+LightProtocol describes the light pulses and knows when the irradiance changes
+next. FastForward detects quiescent intervals (light off, Izhikevich neuron
+converged to rest, photocurrent negligible) and jumps straight to the next
+light edge instead of stepping every dt:
+
+    - in the dark the four-state ChR2 model is linear, so the channel states
+      are advanced exactly with a matrix exponential
+    - the Izhikevich model is linearized around its resting point, which is
+      accurate while v stays within the convergence band
+    - the samples of the skipped steps are only computed if something asks
+      for them (SkippedInterval), e.g. the graphs or the model traces
+
+"""
+import math
+import numpy as np
+from propagator import expm, powerSeries
+
+class LightProtocol:
+    # the light is on (light_intensity) for start <= t <= start + width of every pulse
+    def __init__(self, pulse_times, pulse_widths, light_intensity):
+        self.pulses = sorted(zip(pulse_times, pulse_widths))
+        self.light_intensity = light_intensity
+
+    def getIrradiance(self, t):
+        for start, width in self.pulses:
+            if start <= t <= start + width:
+                return self.light_intensity
+        return 0
+
+    # first time after t at which getIrradiance() can change, inf if it never does
+    def nextEdge(self, t):
+        for start, width in self.pulses:
+            if t < start:
+                return start
+            if t <= start + width:
+                return start + width
+        return math.inf
+
+class SkippedInterval:
+    # n_steps time steps starting at start_time, the states [v, u, c1, o1, o2, c2]
+    # after every step are P^k applied to the initial deviation from rest
+    def __init__(self, start_time, dt, n_steps, propagator, deviation0, rest, current_scale, gamma):
+        self.start_time = start_time
+        self.dt = dt
+        self.n_steps = n_steps
+        self.end_time = start_time + n_steps*dt
+        self.propagator = propagator
+        self.deviation0 = deviation0
+        self.rest = rest
+        self.current_scale = current_scale
+        self.gamma = gamma
+        self.states = None
+
+    def getTimes(self):
+        return self.start_time + np.arange(self.n_steps)*self.dt
+
+    # (n_steps+1, 6) array of states, row k is the state after k steps
+    def getStates(self):
+        if self.states is None:
+            self.states = powerSeries(self.propagator, self.deviation0, self.n_steps + 1) + self.rest
+        return self.states
+
+    # membrane potential after every step, as plotted by the simulation loop
+    def getMembranePotentials(self):
+        return self.getStates()[1:, 0]
+
+    # photocurrent after every step
+    def getPhotocurrents(self):
+        states = self.getStates()[1:]
+        return self.current_scale * (states[:, 3] + self.gamma*states[:, 4])
+
+    def getIrradiances(self):
+        return np.zeros(self.n_steps)
+
+class FastForward:
+    def __init__(self, membrane_model, opsin, protocol, dt, current_tolerance=0.05, min_steps=10, record=True):
+        # Izhikevich membrane model and Channelrhodopsin (four-state model) of the neuron
+        self.membrane_model = membrane_model
+        self.opsin = opsin
+        self.protocol = protocol
+        self.dt = dt
+        # largest |photocurrent| (pA/pF) that still counts as quiescent
+        self.current_tolerance = current_tolerance
+        # shorter quiescent intervals are stepped normally
+        self.min_steps = min_steps
+        # also append the skipped samples to the model traces (vs, Is or their trace writers)
+        self.record = record
+
+    def isQuiescent(self, t):
+        return (self.protocol.getIrradiance(t) == 0 and self.membrane_model.isConverged()
+                and abs(self.opsin.getI()) <= self.current_tolerance)
+
+    # number of steps t, t+dt, ... before the next light edge and before end_time
+    def getQuiescentSteps(self, t, end_time):
+        until = min(self.protocol.nextEdge(t), end_time)
+        if until == math.inf:
+            return 0
+        return max(int(math.ceil((until - t)/self.dt - 1e-9)), 0)
+
+    # advances the models over the quiescent interval starting at t and returns it as
+    # a SkippedInterval, or returns None if t has to be stepped normally
+    def skip(self, t, end_time):
+        if not self.isQuiescent(t):
+            return None
+        n_steps = self.getQuiescentSteps(t, end_time)
+        if n_steps < self.min_steps:
+            return None
+
+        izhikevich = self.membrane_model
+        model = self.opsin.getModel()
+        V = self.opsin.getHoldingPotential() if self.opsin.Vclamp else izhikevich.getMembranePotential()
+        current_scale = model.getCurrentScale(V, self.opsin.g_ChR2)
+
+        # linear system for the deviation of v and u from rest and the channel states,
+        # the neuron receives |I| = |current_scale|*(o1 + gamma*o2)
+        v_rest = izhikevich.getRestingPotential()
+        generator = np.zeros((6, 6))
+        generator[0, 0] = 0.08*v_rest + 5.0
+        generator[0, 1] = -1.0
+        generator[0, 3] = abs(current_scale)
+        generator[0, 4] = abs(current_scale)*model.gamma
+        generator[1, 0] = izhikevich.a*izhikevich.b
+        generator[1, 1] = -izhikevich.a
+        generator[2:, 2:] = model.getGenerator(0, V, self.opsin.wavelength, model.p)
+
+        rest = np.array([v_rest, izhikevich.b*v_rest, 0.0, 0.0, 0.0, 0.0])
+        state = np.array([izhikevich.v, izhikevich.u, model.c1, model.o1, model.o2, model.c2])
+        skipped = SkippedInterval(t, self.dt, n_steps, expm(generator*self.dt), state - rest,
+                                  rest, current_scale, model.gamma)
+
+        # end state, p relaxes towards its dark value in closed form
+        v, u, c1, o1, o2, c2 = (float(x) for x in expm(generator*(n_steps*self.dt)) @ (state - rest) + rest)
+        p_dark = model.So(0)
+        p = p_dark + (model.p - p_dark)*math.exp(-n_steps*self.dt/model.T_ChR2)
+        I_ChR2 = current_scale*(o1 + model.gamma*o2)
+
+        if self.record:
+            izhikevich.extendTrace(skipped.getStates()[:-1, 0])
+            model.extendTrace(skipped.getPhotocurrents())
+
+        model.setState(c1, o1, o2, c2, p)
+        self.opsin.setI(I_ChR2)
+        izhikevich.setState(v, u, abs(I_ChR2))
+
+        return skipped
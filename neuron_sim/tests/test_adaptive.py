@@ -0,0 +1,54 @@
+import math
+import numpy as np
+import pytest
+from adaptive import AdaptiveIntegrator
+from headless import buildModels, getLightProtocol, getParameters, runProtocol
+
+
+def adaptiveRun(sim_time, Vclamp, **options):
+
+    parameters = getParameters({'sim_time': sim_time, 'Vclamp': Vclamp})
+    izhikevich, four_state_model, ChR2 = buildModels(parameters)
+    integrator = AdaptiveIntegrator(izhikevich, ChR2, getLightProtocol(parameters), **options)
+    integrator.run(0.0, sim_time)
+    return (integrator, izhikevich.spike_times.view())
+
+
+@pytest.mark.parametrize('Vclamp', [True, False])
+def test_spikes_match_fine_euler(Vclamp):
+
+    integrator, spike_times = adaptiveRun(200.0, Vclamp=Vclamp, rtol=1E-7, atol=1E-9)
+    euler = runProtocol(dt=0.002, sim_time=200.0, Vclamp=Vclamp)['spike_times']
+
+    assert len(spike_times) == len(euler) > 2
+    #Euler at dt = 0.002 ms is itself ~0.03 ms late after a few spikes
+    assert np.allclose(spike_times, euler, rtol=0, atol=0.05)
+
+
+def test_unclamped_default_protocol():
+
+    integrator, spike_times = adaptiveRun(600.0, Vclamp=False)
+    assert len(spike_times) == len(runProtocol(Vclamp=False)['spike_times']) == 8
+    assert integrator.getStats()['rejected'] > 0
+    assert np.all(np.isfinite(integrator.getState()))
+
+
+def test_overflowing_step_is_rejected():
+
+    parameters = getParameters({'Vclamp': False})
+    izhikevich, four_state_model, ChR2 = buildModels(parameters)
+    integrator = AdaptiveIntegrator(izhikevich, ChR2, getLightProtocol(parameters))
+    y = integrator.getState()
+    f = integrator.getDerivatives(y, 5.0)
+
+    #v blows up within a 10 ms step: inf/nan stages, or a math.exp overflow in the ChR2 rates
+    for v in (0.0, -1E5):
+        start = y.copy()
+        start[0] = v
+        y_new, f_new, error = integrator.step(start, f, 10.0, 5.0)
+        assert error == math.inf and y_new is start
+
+    #without room to shrink the step the run stops instead of accepting it
+    integrator = AdaptiveIntegrator(izhikevich, ChR2, getLightProtocol(parameters), h_initial=20.0, h_min=20.0, h_max=20.0)
+    with pytest.raises(OverflowError):
+        integrator.run(0.0, 600.0)
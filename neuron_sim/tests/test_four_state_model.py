@@ -0,0 +1,45 @@
+import pytest
+from four_state_model import FourStateModel
+
+
+def photocurrent(integrator, dt, duration=60.0, irradiance=5.5, V=-70.0):
+
+    model = FourStateModel(0.1, 0.05, 0.8535, 0.14, 12*(10**-20), 1.3, 1.3)
+    model.setIntegrator(integrator)
+    for _ in range(int(round(duration/dt))):
+        I = model.getPhotocurrent(irradiance, V, dt, 470, 2.0/5, 0.0)
+    return I
+
+
+def test_exponential_integrator_matches_fine_euler():
+
+    reference = photocurrent('euler', 0.001)
+    assert photocurrent('exponential', 0.5) == pytest.approx(reference, rel=1E-3)
+
+
+def test_unknown_integrator():
+
+    with pytest.raises(ValueError):
+        FourStateModel(0.1, 0.05, 0.8535, 0.14, 12*(10**-20), 1.3, 1.3).setIntegrator('rk4')
+
+
+def test_parameter_change_is_not_served_from_the_propagator_cache():
+
+    model = FourStateModel(0.1, 0.05, 0.8535, 0.14, 12*(10**-20), 1.3, 1.3)
+    model.setIntegrator('exponential')
+    for _ in range(200):
+        model.getPhotocurrent(5.5, -70.0, 0.5, 470, 2.0/5, 0.0)
+
+    #same state, new parameters, against a model built with them
+    fresh = FourStateModel(0.1, 0.5, 0.8535, 0.14, 6*(10**-20), 1.3, 1.3)
+    fresh.setIntegrator('exponential')
+    fresh.setState(model.c1, model.o1, model.o2, model.c2, model.p)
+    model.sigma_ret = 6*(10**-20)
+    model.Gd2 = 0.5
+    for _ in range(20):
+        I = model.getPhotocurrent(5.5, -70.0, 0.5, 470, 2.0/5, 0.0)
+        expected = fresh.getPhotocurrent(5.5, -70.0, 0.5, 470, 2.0/5, 0.0)
+    assert I == pytest.approx(expected, rel=1E-12)
+
+    model.reset()
+    assert len(model.propagators.propagators) == 0
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from four_state_model import FourStateModel
+from four_state_population import FourStatePopulation
+
+PARAMETERS = (0.1, 0.05, 0.8535, 0.14, 12*(10**-20), 1.3, 1.3)
+IRRADIANCES = np.array([0.0, 0.5, 5.5, 20.0])
+VOLTAGES = np.array([-70.0, -40.0, 0.0, 20.0])
+
+
+@pytest.mark.parametrize('temp', [22, 35])
+def test_rows_match_single_models(temp):
+
+    population = FourStatePopulation(len(IRRADIANCES), *PARAMETERS)
+    population.temp = temp
+    singles = [FourStateModel(*PARAMETERS) for _ in IRRADIANCES]
+    for single in singles:
+        single.temp = temp
+
+    for step in range(3000):
+        #the light goes on after 10 ms
+        on = 1.0 if step >= 500 else 0.0
+        I = population.getPhotocurrent(on*IRRADIANCES, VOLTAGES, 0.02, 470, 2.0/5, 0.0)
+        expected = [single.getPhotocurrent(on*irr, V, 0.02, 470, 2.0/5, 0.0) for single, irr, V in zip(singles, IRRADIANCES, VOLTAGES)]
+        assert np.allclose(I, expected, rtol=1E-9, atol=1E-12)
+
+    assert np.allclose(population.o1, [single.getO1() for single in singles], rtol=1E-9, atol=1E-12)
+    assert np.allclose(population.c2, [single.getC2() for single in singles], rtol=1E-9, atol=1E-12)
+    assert np.count_nonzero(I) == 3
+
+
+def test_reset():
+
+    population = FourStatePopulation(2, *PARAMETERS)
+    population.getPhotocurrent(5.5, -70.0, 0.02, 470, 2.0/5, 0.0)
+    population.reset()
+    assert population.c1.tolist() == [1.0, 1.0] and population.I.tolist() == [0.0, 0.0]
@@ -0,0 +1,47 @@
+import numpy as np
+from frame_scheduler import FrameScheduler, PlotBuffer
+
+
+def test_fixed_steps_per_frame():
+
+    scheduler = FrameScheduler(0.02, steps_per_frame=250)
+    for _ in range(3):
+        assert scheduler.startFrame() == 250
+        scheduler.physicsDone(250)
+        scheduler.endFrame()
+
+
+def test_adaptive_steps_grow_and_respect_sim_speed():
+
+    scheduler = FrameScheduler(0.02, target_fps=30.0)
+    steps = [scheduler.startFrame()]
+    for _ in range(8):
+        scheduler.physicsDone(steps[-1])
+        scheduler.endFrame()
+        steps.append(scheduler.startFrame())
+    #the batch at most doubles per frame while the physics is far cheaper than a frame
+    assert steps[1] >= steps[0]
+    assert all(later <= 2*earlier for earlier, later in zip(steps, steps[1:]))
+
+    #real time at 30 fps and dt = 0.02 ms is 1000/(30*0.02) steps per frame at most
+    capped = FrameScheduler(0.02, target_fps=30.0, sim_speed=1000.0)
+    capped.step_time = 1E-9
+    capped.steps = 10**6
+    assert capped.getSteps() == int(1000.0/(30.0*0.02))
+
+
+def test_plot_buffer_batches_points():
+
+    buffer = PlotBuffer(0.5)
+    buffer.add(np.array([0, 1]), np.array([1.0, 2.0]))
+    buffer.add(np.array([4]), np.array([3.0]))
+
+    class Curve:
+        calls = []
+        def plot(self, points):
+            self.calls.append(points)
+
+    curve = Curve()
+    buffer.flush(curve)
+    buffer.flush(curve)
+    assert curve.calls == [[(0.0, 1.0), (0.5, 2.0), (2.0, 3.0)]]
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+from headless import getParameters, runProtocol
+
+
+def test_fast_forward_matches_stepping():
+
+    stepped = runProtocol(sim_time=300.0, fast_forward_enabled=False)
+    skipped = runProtocol(sim_time=300.0)
+
+    assert len(skipped['t']) == len(stepped['t'])
+    assert len(skipped['spike_times']) == len(stepped['spike_times'])
+    #the stepped loop turns the light on one step late (see headless.py)
+    assert np.allclose(skipped['spike_times'], stepped['spike_times'], atol=0.021)
+
+
+def test_unknown_parameter():
+
+    with pytest.raises(ValueError):
+        getParameters({'light_intensty': 1.0})
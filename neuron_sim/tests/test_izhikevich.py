@@ -0,0 +1,18 @@
+from headless import HeadlessSimulation, buildModels, getLightProtocol, getParameters
+
+
+def firstSpike(dt, interpolate_spikes):
+
+    parameters = getParameters({'dt': dt, 'sim_time': 150.0, 'fast_forward_enabled': False})
+    izhikevich, four_state_model, ChR2 = buildModels(parameters)
+    izhikevich.interpolate_spikes = interpolate_spikes
+    results = HeadlessSimulation(izhikevich, ChR2, getLightProtocol(parameters), dt, False).run(150.0)
+    return results['spike_times'][0]
+
+
+def test_interpolated_spikes_at_coarse_dt():
+
+    reference = firstSpike(0.001, False)
+    interpolated = abs(firstSpike(0.1, True) - reference)
+    assert interpolated < 0.06
+    assert interpolated < abs(firstSpike(0.1, False) - reference)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from izhikevich import Izhikevich
+from izhikevich_population import IzhikevichPopulation, presets
+
+NAMES = ['regular_spiking', 'fast_spiking', 'chattering', 'regular_spiking']
+CURRENTS = np.array([10.0, 14.0, 6.0, 0.0])
+
+
+@pytest.mark.parametrize('dt, interpolate_spikes', [(0.02, False), (0.2, True)])
+def test_rows_match_single_models(dt, interpolate_spikes):
+
+    population = IzhikevichPopulation.fromPresets(dt, NAMES)
+    population.interpolate_spikes = interpolate_spikes
+    singles = [Izhikevich(dt, *presets[name], 30.0) for name in NAMES]
+    for single in singles:
+        single.interpolate_spikes = interpolate_spikes
+
+    for step in range(int(round(200.0/dt))):
+        t = step*dt
+        population.updateMembranePotential(t, CURRENTS)
+        for single, I in zip(singles, CURRENTS):
+            single.updateMembranePotential(t, I)
+        assert np.allclose(population.getMembranePotential(), [single.v for single in singles], rtol=1E-9, atol=1E-9)
+
+    indices, times = population.getSpikes()
+    assert len(indices) > 10
+    for k, single in enumerate(singles):
+        assert np.allclose(times[indices == k], single.spike_times.view(), rtol=0, atol=1E-9)
+
+
+def test_broadcast_parameters():
+
+    population = IzhikevichPopulation(0.02, 0.02, 0.2, [-65.0, -50.0], 8.0, 30.0)
+    assert population.size == 2
+    assert population.c.tolist() == [-65.0, -50.0]
+    assert np.allclose(population.getRestingPotential(), Izhikevich(0.02, 0.02, 0.2, -65.0, 8.0, 30.0).getRestingPotential())
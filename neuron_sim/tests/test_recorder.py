@@ -0,0 +1,27 @@
+import numpy as np
+from recorder import ChunkedRecorder, RingRecorder
+
+
+def test_ring_recorder_keeps_the_last_samples():
+
+    recorder = RingRecorder(5)
+    recorder.extend(np.arange(3.0))
+    for value in range(3, 7):
+        recorder.append(float(value))
+    assert recorder.view().tolist() == [2.0, 3.0, 4.0, 5.0, 6.0]
+
+    recorder.extend(np.arange(10.0, 22.0))
+    assert recorder.view().tolist() == [17.0, 18.0, 19.0, 20.0, 21.0]
+    assert len(recorder) == 5
+
+
+def test_chunked_recorder_grows_over_chunks():
+
+    recorder = ChunkedRecorder(chunk_size=4)
+    recorder.extend(np.arange(6.0))
+    for value in range(6, 11):
+        recorder.append(float(value))
+    assert recorder.view().tolist() == list(map(float, range(11)))
+
+    recorder.clear()
+    assert len(recorder.view()) == 0
@@ -0,0 +1,17 @@
+import pytest
+from four_state_model import FourStateModel
+from voltage_clamp import ClampSweep
+
+
+def test_clamp_sweep_matches_single_model():
+
+    model = FourStateModel(0.1, 0.05, 0.8535, 0.14, 12*(10**-20), 1.3, 1.3)
+    results = ClampSweep(model, 0.02, 2.0/5, 470, light_delay=10.0, tail_time=20.0).run([-70.0, 0.0], [5.5], [50.0])
+
+    #the light is on for 10 <= t <= 60, the last step of the pulse starts at t = 60
+    for k, V in enumerate([-70.0, 0.0]):
+        single = FourStateModel(0.1, 0.05, 0.8535, 0.14, 12*(10**-20), 1.3, 1.3)
+        for step in range(int(round(60.0/0.02)) + 1):
+            irradiance = 5.5 if step*0.02 >= 10.0 else 0.0
+            I = single.getPhotocurrent(irradiance, V, 0.02, 470, 2.0/5, 0.0)
+        assert results['steady_state'][k, 0, 0] == pytest.approx(I, rel=1E-6)
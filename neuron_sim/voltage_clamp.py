@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch voltage-clamp protocols for I-V and irradiance-response curves
+
+ClampSweep runs every combination of holding potential x irradiance x pulse
+width at once: each grid point is one member of a FourStatePopulation, so the
+whole grid is advanced with one set of array operations per time step instead
+of re-running the simulation loop once per setting.
+
+Every grid point sees a single pulse, light on for light_delay <= t <= light_delay + width
+(as in simulation.LightProtocol), and is followed for tail_time after the light goes off.
+Measured per grid point:
+
+    peak            photocurrent of largest magnitude during the pulse (pA/pF)
+    time_to_peak    time of the peak after light onset (ms)
+    steady_state    photocurrent at the end of the pulse (pA/pF)
+    decay_time      time after light off for the current to fall to 1/e of its
+                    value at light off (ms), nan if that is not reached in tail_time
+
+    e.g. ClampSweep(four_state_model, dt, g_ChR2, wavelength).run([-80, -40, 0, 40], [0.5, 5.5], [400])
+
+"""
+import math
+import numpy as np
+from four_state_population import FourStatePopulation
+
+class ClampSweep:
+    def __init__(self, model, dt, g_ChR2, wavelength, E_ChR2=0.0, light_delay=50.0, tail_time=100.0):
+        # FourStateModel whose parameters (and temperature) are used for every grid point
+        self.model = model
+        self.dt = dt
+        self.g_ChR2 = g_ChR2
+        self.wavelength = wavelength
+        self.E_ChR2 = E_ChR2
+        self.light_delay = light_delay
+        self.tail_time = tail_time
+
+    def getPopulation(self, size):
+        model = self.model
+        population = FourStatePopulation(size, model.gamma, model.Gd2, model.ep1, model.ep2,
+                                          model.sigma_ret, model.w_loss, model.T_ChR2)
+        population.temp = model.temp
+        population.temp_scale = model.temp_scale
+        return population
+
+    # runs the grid, returns a dict with the axes ('holding_potentials', 'irradiances',
+    # 'pulse_widths') and the metrics, each an array of shape (potentials, irradiances, widths);
+    # with record_traces the photocurrent of every grid point after every step is added as 'traces'
+    # with shape (steps, potentials, irradiances, widths) and the step times as 'times'
+    def run(self, holding_potentials, irradiances, pulse_widths, record_traces=False):
+        holding_potentials = np.atleast_1d(np.asarray(holding_potentials, dtype=float))
+        irradiances = np.atleast_1d(np.asarray(irradiances, dtype=float))
+        pulse_widths = np.atleast_1d(np.asarray(pulse_widths, dtype=float))
+        shape = (len(holding_potentials), len(irradiances), len(pulse_widths))
+
+        # one population member per grid point
+        V, irr, width = (x.ravel() for x in np.meshgrid(holding_potentials, irradiances, pulse_widths, indexing='ij'))
+        size = V.size
+        population = self.getPopulation(size)
+        light_off = self.light_delay + width
+
+        peak = np.zeros(size)
+        time_to_peak = np.full(size, np.nan)
+        steady_state = np.zeros(size)
+        decay_time = np.full(size, np.nan)
+        I_previous = np.zeros(size)
+
+        n_steps = int(math.ceil((self.light_delay + pulse_widths.max() + self.tail_time)/self.dt))
+        traces = np.empty((n_steps, size)) if record_traces else None
+
+        for k in range(n_steps):
+            t = k*self.dt
+            on = (t >= self.light_delay) & (t <= light_off)
+            I = population.getPhotocurrent(np.where(on, irr, 0.0), V, self.dt, self.wavelength, self.g_ChR2, self.E_ChR2)
+            if record_traces:
+                traces[k] = I
+
+            # peak and the current at the last step of the pulse
+            larger = on & (np.abs(I) > np.abs(peak))
+            peak[larger] = I[larger]
+            time_to_peak[larger] = t - self.light_delay
+            steady_state[on] = I[on]
+
+            # first drop below 1/e of the current at light off, interpolated between the steps
+            threshold = np.abs(steady_state)*math.exp(-1)
+            decayed = (t > light_off) & np.isnan(decay_time) & (steady_state != 0) & (np.abs(I) <= threshold)
+            if decayed.any():
+                previous = np.abs(I_previous[decayed])
+                fraction = (previous - threshold[decayed])/(previous - np.abs(I[decayed]))
+                decay_time[decayed] = np.maximum(t - self.dt*(1 - fraction) - light_off[decayed], 0.0)
+            I_previous = I
+
+        results = {'holding_potentials': holding_potentials,
+                   'irradiances': irradiances,
+                   'pulse_widths': pulse_widths,
+                   'peak': peak.reshape(shape),
+                   'time_to_peak': time_to_peak.reshape(shape),
+                   'steady_state': steady_state.reshape(shape),
+                   'decay_time': decay_time.reshape(shape)}
+        if record_traces:
+            results['times'] = np.arange(n_steps)*self.dt
+            results['traces'] = traces.reshape((n_steps,) + shape)
+        return results